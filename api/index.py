@@ -4,16 +4,111 @@
 # It securely loads all credentials from environment variables.
 # ====================================================================
 
+import time
+_module_started = time.perf_counter()
+
 import os
+import sys
 import json
-from functools import wraps
-from datetime import datetime, timedelta
-from flask import Flask, request, jsonify
+import importlib
+import re
+import html
+import base64
+import csv
+import io
+import hmac
+import hashlib
+import string
+import threading
+import unicodedata
+import uuid
+from collections import OrderedDict
+from functools import wraps, lru_cache
+from datetime import datetime, date, timedelta, timezone
+from urllib.parse import quote
+from flask import Flask, Response, request, jsonify, g, stream_with_context, has_request_context
 from flask_cors import CORS
-import firebase_admin
-from firebase_admin import credentials, auth, firestore, storage
-import sib_api_v3_sdk
-from sib_api_v3_sdk.rest import ApiException
+from werkzeug.exceptions import HTTPException
+
+# --- LAZY CLIENTS ---
+
+# Firebase, Google Cloud and Brevo are imported and initialized on first use,
+# so a cold start only pays for what the request actually touches (an OPTIONS
+# preflight touches none of it). Set STARTUP_PROFILE=1 to log how long each
+# import and client initialization takes.
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE") == "1"
+startup_timings = {}
+
+def record_startup(component, started):
+    startup_timings[component] = round((time.perf_counter() - started) * 1000, 2)
+    if STARTUP_PROFILE:
+        print(json.dumps({'event': 'startup', 'component': component, 'ms': startup_timings[component]}), file=sys.stderr)
+
+class LazyModule:
+    """Module stand-in that imports the real module on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            started = time.perf_counter()
+            self._module = importlib.import_module(self._name)
+            record_startup(f"import {self._name}", started)
+        return getattr(self._module, attr)
+
+firebase_admin = LazyModule('firebase_admin')
+credentials = LazyModule('firebase_admin.credentials')
+auth = LazyModule('firebase_admin.auth')
+firestore = LazyModule('firebase_admin.firestore')
+storage = LazyModule('firebase_admin.storage')
+api_exceptions = LazyModule('google.api_core.exceptions')
+sib_api_v3_sdk = LazyModule('sib_api_v3_sdk')
+sib_rest = LazyModule('sib_api_v3_sdk.rest')
+
+class ClientRegistry:
+    """Creates each external client on first use and keeps it for the life of the warm instance."""
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._lock = threading.RLock()
+
+    def register(self, name, factory):
+        self._factories[name] = factory
+
+    def get(self, name):
+        instance = self._instances.get(name)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(name)
+                if instance is None:
+                    started = time.perf_counter()
+                    instance = self._factories[name]()
+                    record_startup(name, started)
+                    self._instances[name] = instance
+        return instance
+
+    def set(self, name, instance):
+        """Replaces a client, e.g. with a local fake."""
+        with self._lock:
+            self._instances[name] = instance
+
+    def reset(self, name):
+        with self._lock:
+            self._instances.pop(name, None)
+
+class LazyClient:
+    """Stands in for a registry client so call sites can keep using `db` and `bucket`."""
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(clients.get(self._name), attr)
+
+clients = ClientRegistry()
 
 # --- Vercel Deployment Changes START ---
 
@@ -26,35 +121,36 @@ app = Flask(__name__)
 CORS(app, resources={r"/api/*": {
     "origins": "https://lifewood-onyx.vercel.app",
     "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    "allow_headers": ["Content-Type", "Authorization"]
+    "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key"],
+    "expose_headers": ["Retry-After", "Idempotent-Replayed"]
 }})
 
 @app.route('/api/some_endpoint')
 def some_endpoint():
     return jsonify({"message": "Success"})
-# Securely load Firebase credentials from Vercel environment variable
-cred_json_str = os.getenv("GOOGLE_APPLICATION_CREDENTIALS_JSON")
-if not cred_json_str:
-    raise ValueError("The GOOGLE_APPLICATION_CREDENTIALS_JSON environment variable is not set.")
-
-try:
-    cred_json = json.loads(cred_json_str)
-    cred = credentials.Certificate(cred_json)
-    
-    # Initialize Firebase Admin SDK
-    # The try/except block prevents crashing if the app is already initialized in the serverless environment
-    if not firebase_admin._apps:
-        firebase_admin.initialize_app(cred, {
-            'storageBucket': 'lifewood-applicants-aa9bc.firebasestorage.app'
-        })
-except json.JSONDecodeError:
-    raise ValueError("Failed to decode GOOGLE_APPLICATION_CREDENTIALS_JSON. Ensure it's a valid JSON string.")
 
+def init_firebase_app():
+    # Securely load Firebase credentials from Vercel environment variable
+    cred_json_str = os.getenv("GOOGLE_APPLICATION_CREDENTIALS_JSON")
+    if not cred_json_str:
+        raise RuntimeError("The GOOGLE_APPLICATION_CREDENTIALS_JSON environment variable is not set.")
+    try:
+        cred_json = json.loads(cred_json_str)
+    except json.JSONDecodeError:
+        raise RuntimeError("Failed to decode GOOGLE_APPLICATION_CREDENTIALS_JSON. Ensure it's a valid JSON string.")
+
+    # The check prevents crashing if the app is already initialized in the serverless environment
+    if firebase_admin._apps:
+        return firebase_admin.get_app()
+    return firebase_admin.initialize_app(credentials.Certificate(cred_json), {
+        'storageBucket': 'lifewood-applicants-aa9bc.firebasestorage.app'
+    })
 
-# NEW CORRECT CODE
-# NEW, CORRECT CODE
-db = firestore.client()
-bucket = storage.bucket()
+clients.register('firebase', init_firebase_app)
+clients.register('firestore', lambda: instrument_firestore(firestore.client(app=clients.get('firebase'))))
+clients.register('storage', lambda: instrument_storage(storage.bucket(app=clients.get('firebase'))))
+db = LazyClient('firestore')
+bucket = LazyClient('storage')
 
 # --- Vercel Deployment Changes END ---
 
@@ -64,6 +160,234 @@ def catch_all_options(path):
     # The CORS extension will handle adding the correct headers.
     return jsonify(success=True), 200
 
+# --- REQUEST METRICS ---
+
+# Every /api/* request records its latency in a per-route histogram along with
+# how many Firestore documents it read and wrote and how many Storage, Brevo
+# and token-verification calls it made. Each response carries a Server-Timing
+# header and emits one JSON log line; /api/_metrics reports per-route p50/p95/p99.
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+METRIC_COUNTERS = ['firestore_reads', 'firestore_writes', 'storage_calls', 'brevo_calls', 'token_verifications']
+
+def track(counter, amount=1):
+    if has_request_context():
+        counts = g.setdefault('metric_counts', {})
+        counts[counter] = counts.get(counter, 0) + amount
+
+def track_time(component, started):
+    if has_request_context():
+        timings = g.setdefault('metric_timings', {})
+        timings[component] = timings.get(component, 0.0) + (time.perf_counter() - started) * 1000
+
+class RouteMetrics:
+    """Latency histograms and call totals per route, kept for the life of the warm instance."""
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+        self.started_at = datetime.now(timezone.utc)
+
+    def observe(self, route, status_code, elapsed_ms, counts):
+        with self._lock:
+            stats = self._routes.setdefault(route, {
+                'count': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'buckets': [0] * (len(LATENCY_BUCKETS_MS) + 1), 'totals': dict.fromkeys(METRIC_COUNTERS, 0),
+            })
+            stats['count'] += 1
+            stats['errors'] += status_code >= 500
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            stats['buckets'][next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= bound), len(LATENCY_BUCKETS_MS))] += 1
+            for counter, amount in counts.items():
+                stats['totals'][counter] = stats['totals'].get(counter, 0) + amount
+
+    @staticmethod
+    def percentile(stats, q):
+        """Estimates a percentile by interpolating inside the histogram bucket that contains it."""
+        target = q * stats['count']
+        cumulative = 0
+        for i, bucket_count in enumerate(stats['buckets']):
+            if bucket_count and cumulative + bucket_count >= target:
+                lower = LATENCY_BUCKETS_MS[i - 1] if i > 0 else 0
+                upper = LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else stats['max_ms']
+                upper = min(upper, stats['max_ms'])
+                return round(lower + (max(upper, lower) - lower) * (target - cumulative) / bucket_count, 2)
+            cumulative += bucket_count
+        return 0.0
+
+    def snapshot(self):
+        with self._lock:
+            routes = {}
+            for route, stats in self._routes.items():
+                routes[route] = {
+                    'count': stats['count'],
+                    'errors': stats['errors'],
+                    'mean_ms': round(stats['total_ms'] / stats['count'], 2),
+                    'p50_ms': self.percentile(stats, 0.50),
+                    'p95_ms': self.percentile(stats, 0.95),
+                    'p99_ms': self.percentile(stats, 0.99),
+                    'max_ms': round(stats['max_ms'], 2),
+                    'histogram': dict(zip([f'le_{b}' for b in LATENCY_BUCKETS_MS] + ['le_inf'], stats['buckets'])),
+                    'totals': dict(stats['totals']),
+                }
+            return {'since': self.started_at.isoformat(), 'routes': routes}
+
+route_metrics = RouteMetrics()
+
+class CountingStream:
+    """Wraps a streaming Firestore RPC to count documents and time spent waiting on them."""
+
+    def __init__(self, stream, document_field):
+        self._stream = stream
+        self._document_field = document_field
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            response = next(self._stream)
+        finally:
+            track_time('firestore', started)
+        if self._document_field in response:
+            track('firestore_reads')
+        return response
+
+    def __getattr__(self, attr):
+        return getattr(self._stream, attr)
+
+def instrument_firestore(client):
+    """Counts document reads and writes by wrapping the client's RPC stubs."""
+    try:
+        api = client._firestore_api
+    except AttributeError:
+        print("Firestore client does not expose its RPC stubs; Firestore calls will not be counted.")
+        return client
+    for name, document_field in (('run_query', 'document'), ('batch_get_documents', 'found')):
+        def streaming_call(*args, _call=getattr(api, name), _field=document_field, **kwargs):
+            started = time.perf_counter()
+            stream = _call(*args, **kwargs)
+            track_time('firestore', started)
+            return CountingStream(iter(stream), _field)
+        setattr(api, name, streaming_call)
+
+    def commit(*args, _call=api.commit, **kwargs):
+        commit_request = kwargs.get('request', args[0] if args else {})
+        writes = commit_request.get('writes', []) if isinstance(commit_request, dict) else getattr(commit_request, 'writes', [])
+        track('firestore_writes', len(writes))
+        started = time.perf_counter()
+        try:
+            return _call(*args, **kwargs)
+        finally:
+            track_time('firestore', started)
+    api.commit = commit
+    return client
+
+def instrument_storage(bucket):
+    """Counts Storage HTTP calls, including each chunk of a resumable upload."""
+    session = bucket.client._http
+    original_request = session.request
+    def counted_request(*args, **kwargs):
+        track('storage_calls')
+        started = time.perf_counter()
+        try:
+            return original_request(*args, **kwargs)
+        finally:
+            track_time('storage', started)
+    session.request = counted_request
+    return bucket
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    # Streaming responses (the exports) are measured up to the first byte.
+    if not request.path.startswith('/api/') or 'request_started' not in g:
+        return response
+    elapsed_ms = (time.perf_counter() - g.request_started) * 1000
+    counts = g.get('metric_counts', {})
+    timings = g.get('metric_timings', {})
+    # Unmatched requests share one key; keying on the client's path would let
+    # made-up URLs grow the metrics without bound.
+    route = f"{request.method} {request.url_rule.rule if request.url_rule else '<unmatched>'}"
+    route_metrics.observe(route, response.status_code, elapsed_ms, counts)
+
+    server_timing = [f'app;dur={elapsed_ms:.1f}']
+    server_timing += [f'{component};dur={ms:.1f}' for component, ms in timings.items()]
+    if counts:
+        server_timing.append('calls;desc="' + ' '.join(f'{counter}={amount}' for counter, amount in counts.items()) + '"')
+    response.headers['Server-Timing'] = ', '.join(server_timing)
+    print(json.dumps({
+        'event': 'request', 'method': request.method, 'route': route, 'path': request.path,
+        'status': response.status_code, 'ms': round(elapsed_ms, 2), 'counts': counts,
+        'timings': {component: round(ms, 2) for component, ms in timings.items()},
+    }))
+    return response
+
+@app.errorhandler(Exception)
+def handle_unexpected_error(e):
+    if isinstance(e, HTTPException):
+        return e  # 404/405/413 and friends keep their normal responses
+    print(json.dumps({'event': 'error', 'method': request.method, 'path': request.path,
+                      'error': type(e).__name__, 'detail': str(e)}))
+    return jsonify({"message": "An unexpected server error occurred."}), 500
+
+class TokenCache:
+    """Bounded LRU of verified ID token claims, keyed by token hash and kept until the token's `exp`."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token):
+        key = self._key(token)
+        with self._lock:
+            claims = self._entries.get(key)
+            if claims is not None and claims.get('exp', 0) <= time.time():
+                del self._entries[key]
+                claims = None
+            if claims is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return claims
+
+    def put(self, token, claims):
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = claims
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, token):
+        with self._lock:
+            self._entries.pop(self._key(token), None)
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'maxsize': self.maxsize,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+token_cache = TokenCache(int(os.getenv("TOKEN_CACHE_SIZE", "256")))
+# Optional callable(claims) -> bool run on every authenticated request; returning True rejects the token.
+token_revocation_check = None
+
+def set_token_revocation_check(check):
+    global token_revocation_check
+    token_revocation_check = check
+
 def token_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -71,177 +395,1162 @@ def token_required(f):
         if not auth_header or not auth_header.startswith('Bearer '):
             return jsonify({'message': 'Authentication Token is missing or malformed!'}), 401
         token = auth_header.split(' ')[1]
+        claims = token_cache.get(token)
+        cached = claims is not None
+        if not cached:
+            track('token_verifications')
+            started = time.perf_counter()
+            try:
+                # This will use the initialized Firebase app
+                claims = auth.verify_id_token(token, app=clients.get('firebase'))
+            except Exception as e:
+                return jsonify({'message': 'Invalid or expired token!', 'error': str(e)}), 403
+            finally:
+                track_time('auth', started)
+        # Runs for fresh verifications as well, so a revoked token is never cached.
+        if token_revocation_check and token_revocation_check(claims):
+            token_cache.invalidate(token)
+            return jsonify({'message': 'Token has been revoked!'}), 403
+        if not cached:
+            token_cache.put(token, claims)
+        # Handlers read the caller's identity from here for auditing.
+        g.token_claims = claims
+        return f(*args, **kwargs)
+    return decorated_function
+
+def current_admin():
+    claims = g.get('token_claims') or {}
+    return claims.get('email') or claims.get('uid') or 'unknown'
+
+def audit_fields():
+    return {'updatedBy': current_admin(), 'updatedAt': firestore.SERVER_TIMESTAMP}
+
+# --- EMAIL TEMPLATES ---
+
+# Templates are compiled once at import into tuples of literal text and field
+# names. Everything that depends only on status and position is pre-filled and
+# cached, so rendering an email is a join over a handful of escaped values.
+
+EMAIL_TEMPLATES = {
+    'Received': {
+        'subject': "Your Lifewood Application Has Been Received",
+        'header': "Application Received!",
+        'paragraphs': [
+            "This is to confirm that we have successfully received your application for the <strong>{position}</strong> role at Lifewood.",
+            "Our hiring team is now reviewing applications and will be in touch with the next steps as soon as possible. Thank you for your interest in joining our team!",
+        ],
+        'button_link': "https://lifewood-ony.vercel.app/",
+        'button_text': "Visit Our Website",
+        'closing': "Sincerely",
+    },
+    'Under Review': {
+        'subject': "Update on Your Lifewood Application",
+        'header': "Your Application is Under Review",
+        'paragraphs': [
+            "This is a quick confirmation that we have received your application for the <strong>{position}</strong> role at Lifewood, and it is now under review by our hiring team.",
+            "We appreciate your patience during this process and will be in touch with the next steps as soon as we have an update. Thank you for your interest in joining our team!",
+        ],
+        'button_link': "https://lifewood-ony.vercel.app/",
+        'button_text': "Visit Our Website",
+        'closing': "Sincerely",
+    },
+    'Interview Scheduled': {
+        'subject': "Invitation to Interview with Lifewood",
+        'header': "Invitation to Interview",
+        'paragraphs': [
+            "Congratulations! We were very impressed with your application for the <strong>{position}</strong> role and would like to invite you for an interview.",
+            "{schedule} Please confirm if this time works for you. If you need to reschedule, please reply to this email as soon as possible.",
+            "We look forward to speaking with you!",
+        ],
+        'button_link': "mailto:hr@lifewood.com?subject=Regarding%20Interview%20for%20{position_url}",
+        'button_text': "Confirm or Reschedule",
+        'closing': "Best regards",
+    },
+    'Offer Extended': {
+        'subject': "Exciting News: An Offer of Employment from Lifewood",
+        'header': "A Job Offer from Lifewood",
+        'paragraphs': [
+            "Following your recent interviews for the <strong>{position}</strong> position, we are absolutely delighted to formally extend to you an offer of employment with Lifewood!",
+            "The entire team was thoroughly impressed with your skills and experience. Our Human Resources department will be sending a separate, detailed offer letter for your review, which will include information on compensation, benefits, and your proposed start date.",
+            "We are incredibly excited about the possibility of you joining us.",
+        ],
+        'button_link': "mailto:hr@lifewood.com?subject=Regarding%20My%20Offer%20for%20the%20{position_url}%20Position",
+        'button_text': "Contact HR to Discuss",
+        'closing': "We look forward to hearing from you",
+    },
+    'Hired': {
+        'subject': "An Exciting Update on Your Application with Lifewood",
+        'header': "Welcome to the Lifewood Team!",
+        'paragraphs': [
+            "We are absolutely thrilled to inform you that your application for the <strong>{position}</strong> position at Lifewood has been <strong>successful</strong>!",
+            "Our Human Resources department will be reaching out to you within the next two business days to provide the full offer details, discuss your potential start date, and guide you through our comprehensive onboarding process.",
+        ],
+        'button_link': "mailto:hr@lifewood.com?subject=Regarding%20My%20Job%20Offer",
+        'button_text': "Contact HR",
+        'closing': "Best regards",
+    },
+    'Rejected': {
+        'subject': "An Update on Your Application with Lifewood",
+        'header': "Thank You For Your Interest",
+        'paragraphs': [
+            "Thank you again for your interest in the <strong>{position}</strong> position and for taking the time to interview with our team at Lifewood.",
+            "The selection process was exceptionally competitive, and after careful consideration, we have decided to move forward with another applicant. We will keep your application on file for future opportunities and wish you the very best in your job search.",
+        ],
+        'button_link': "https://lifewood-ony.vercel.app/services.html",
+        'button_text': "Explore Other Roles",
+        'closing': "Sincerely",
+    },
+}
+
+EMAIL_TEAM_NAME = "The Lifewood Recruitment Team"
+EMAIL_PARAGRAPH_OPEN = '<p style="margin:0 0 25px 0;font-size:16px;line-height:1.7;color:#333333;">'
+EMAIL_LAST_PARAGRAPH_OPEN = '<p style="margin:0;font-size:16px;line-height:1.7;color:#333333;">'
+
+EMAIL_HTML_SHELL = """<!DOCTYPE html><html><head><meta charset="UTF-8"><style>@import url('https://fonts.googleapis.com/css2?family=Manrope:wght@400;700;800&display=swap');body{{font-family:'Manrope',Arial,sans-serif;}}</style></head><body style="margin:0;padding:0;background-color:#f5eedb;"><table border="0" cellpadding="0" cellspacing="0" width="100%"><tr><td style="padding:40px 20px;"><table align="center" border="0" cellpadding="0" cellspacing="0" width="600" style="border-collapse:collapse;background-color:#ffffff;border-radius:8px;box-shadow:0 4px 15px rgba(0,0,0,0.1);"><td align="center" style="padding: 30px 20px 20px 20px;"><a href="https://lifewood-ony.vercel.app/" target="_blank" style="text-decoration: none; display: inline-block;"><svg width="24" height="32" viewBox="0 0 24 42" xmlns="http://www.w3.org/2000/svg" style="vertical-align: middle; margin-right: 8px; height: 32px; width: auto;"><path d="M12 0L23.5962 10.5V31.5L12 42L0.403847 31.5V10.5L12 0Z" fill="#FFB347"/></svg><span style="font-family: 'Manrope', Arial, sans-serif; font-size: 30px; font-weight: 800; letter-spacing: -0.5px; color: #133020; vertical-align: middle;">lifewood</span></a></td></tr><tr><td style="padding:20px 40px;"><h1 style="font-size:28px;font-weight:700;color:#046241;margin:0 0 25px 0;text-align:center;">{header}</h1><p style="margin:0 0 15px 0;font-size:16px;line-height:1.7;color:#333333;">Dear {name},</p>{body}</td></tr><tr><td align="center" style="padding:10px 40px 30px 40px;"><a href="{button_link}" target="_blank" style="display:inline-block;padding:14px 35px;background-color:#FFB347;color:#133020;text-decoration:none;font-weight:700;border-radius:5px;font-size:16px;">{button_text}</a></td></tr><tr><td style="padding:0px 40px 40px 40px;"><p style="margin:0;font-size:16px;line-height:1.7;color:#333333;">{closing},</p><p style="margin:5px 0 0 0;font-size:16px;line-height:1.7;color:#333333;">{team}</p></td></tr></table></td></tr></table></body></html>"""
+
+EMAIL_TEXT_SHELL = "Dear {name},\n\n{body}\n\n{button_text}: {button_link}\n\n{closing},\n{team}\n"
+
+def compile_template(source):
+    """Splits a str.format-style template into a tuple of (is_field, text) parts."""
+    parts = []
+    for literal, field, _, _ in string.Formatter().parse(source):
+        if literal:
+            parts.append((False, literal))
+        if field is not None:
+            parts.append((True, field))
+    return tuple(parts)
+
+def fill_template(parts, values):
+    """Substitutes the given fields and leaves the rest for a later fill.
+
+    A value may be a plain string or another compiled template, which is spliced in.
+    """
+    filled = []
+    for is_field, text in parts:
+        if is_field and text in values:
+            value = values[text]
+            filled.extend(value if isinstance(value, tuple) else [(False, value)])
+        else:
+            filled.append((is_field, text))
+    merged = []
+    for is_field, text in filled:
+        if not is_field and merged and not merged[-1][0]:
+            merged[-1] = (False, merged[-1][1] + text)
+        else:
+            merged.append((is_field, text))
+    return tuple(merged)
+
+def render_template(parts, values):
+    return ''.join(values[text] if is_field else text for is_field, text in parts)
+
+def strip_tags(markup):
+    return html.unescape(re.sub(r'<[^>]+>', '', markup))
+
+def compile_status_templates(template):
+    paragraphs = template['paragraphs']
+    body_html = ''.join((EMAIL_LAST_PARAGRAPH_OPEN if i == len(paragraphs) - 1 else EMAIL_PARAGRAPH_OPEN) + p + '</p>'
+                        for i, p in enumerate(paragraphs))
+    static_values = {
+        'header': html.escape(template['header']),
+        'button_link': compile_template(html.escape(template['button_link'])),
+        'button_text': html.escape(template['button_text']),
+        'closing': html.escape(template['closing']),
+        'team': html.escape(EMAIL_TEAM_NAME),
+    }
+    html_parts = fill_template(EMAIL_HTML_SHELL_PARTS, dict(static_values, body=compile_template(body_html)))
+    text_values = {key: compile_template(template[key]) if key == 'button_link' else template.get(key, EMAIL_TEAM_NAME)
+                   for key in ('header', 'button_link', 'button_text', 'closing', 'team')}
+    text_parts = fill_template(EMAIL_TEXT_SHELL_PARTS, dict(text_values, body=compile_template('\n\n'.join(strip_tags(p) for p in paragraphs))))
+    return html_parts, text_parts
+
+EMAIL_HTML_SHELL_PARTS = compile_template(EMAIL_HTML_SHELL)
+EMAIL_TEXT_SHELL_PARTS = compile_template(EMAIL_TEXT_SHELL)
+COMPILED_EMAIL_TEMPLATES = {status: compile_status_templates(template) for status, template in EMAIL_TEMPLATES.items()}
+
+@lru_cache(maxsize=1024)
+def status_position_templates(status, position):
+    """Returns the subject and the HTML/text templates with the position filled in, leaving name and schedule."""
+    html_parts, text_parts = COMPILED_EMAIL_TEMPLATES[status]
+    html_values = {'position': html.escape(position), 'position_url': html.escape(quote(position))}
+    text_values = {'position': position, 'position_url': quote(position)}
+    return EMAIL_TEMPLATES[status]['subject'], fill_template(html_parts, html_values), fill_template(text_parts, text_values)
+
+def interview_schedule(interview_start_time, interview_end_time):
+    """Returns the (html, text) sentence describing the interview slot."""
+    if not (interview_start_time and interview_end_time):
+        sentence = "Our team will reach out to you shortly to coordinate a time."
+        return sentence, sentence
+    try:
+        start_dt = datetime.fromisoformat(interview_start_time)
+        end_dt = datetime.fromisoformat(interview_end_time)
+        slot = f"{start_dt.strftime('%A, %B %d, %Y')} from {start_dt.strftime('%I:%M %p')} to {end_dt.strftime('%I:%M %p')}"
+        return f"We have scheduled your interview on <strong>{slot}</strong>.", f"We have scheduled your interview on {slot}."
+    except (ValueError, TypeError):
+        sentence = f"We have scheduled your interview from {interview_start_time} to {interview_end_time}."
+        return html.escape(sentence), sentence
+
+def render_email(applicant_name, position, status, interview_start_time=None, interview_end_time=None):
+    """Renders the (subject, html, text) of the email for an application status."""
+    if status not in EMAIL_TEMPLATES:
+        raise ValueError(f"No email template for status '{status}'.")
+    subject, html_parts, text_parts = status_position_templates(status, position or '')
+    schedule_html, schedule_text = interview_schedule(interview_start_time, interview_end_time)
+    name = applicant_name or ''
+    html_content = render_template(html_parts, {'name': html.escape(name), 'schedule': schedule_html})
+    text_content = render_template(text_parts, {'name': name, 'schedule': schedule_text})
+    return subject, html_content, text_content
+
+# --- EMAIL OUTBOX ---
+
+# Requests never call the mail API directly. They enqueue a message document in
+# the same write as the change that triggered it, and drain_outbox() delivers due
+# messages later, retrying with exponential backoff before giving up ('dead').
+# The due-message query needs the (state, nextAttemptAt) index in firestore.indexes.json.
+# Vercel Cron calls GET /api/outbox/drain every five minutes (see vercel.json),
+# so delivery does not wait for an admin to open the dashboard. Set CRON_SECRET
+# in the project's environment; Vercel sends it as `Authorization: Bearer ...`.
+OUTBOX_COLLECTION = 'email_outbox'
+OUTBOX_DRAIN_BATCH = 50
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BASE_BACKOFF = timedelta(seconds=60)
+OUTBOX_MAX_BACKOFF = timedelta(hours=1)
+# A claimed message becomes due again after this long if its worker dies mid-send.
+OUTBOX_LEASE = timedelta(minutes=5)
+
+class EmailDeliveryError(Exception):
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+class BrevoTransport:
+    """Sends messages through Brevo, reusing one API client for every send."""
+
+    def __init__(self):
+        api_key = os.getenv("BREVO_API_KEY")
+        self.sender_email = os.getenv("EMAIL_SENDER")
+        if not api_key or not self.sender_email:
+            raise EmailDeliveryError("Email credentials (BREVO_API_KEY or EMAIL_SENDER) are not set in environment variables.")
+        configuration = sib_api_v3_sdk.Configuration()
+        configuration.api_key['api-key'] = api_key
+        self.api_instance = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
+
+    def send(self, recipient_email, recipient_name, subject, html_content, text_content):
+        sender = {"name": "The Lifewood Team", "email": self.sender_email}
+        to = [{"email": recipient_email, "name": recipient_name}]
+        send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(to=to, sender=sender, subject=subject,
+                                                       html_content=html_content, text_content=text_content)
+        track('brevo_calls')
+        started = time.perf_counter()
         try:
-            # This will use the initialized Firebase app
-            auth.verify_id_token(token)
+            self.api_instance.send_transac_email(send_smtp_email)
+        except sib_rest.ApiException as e:
+            # Rate limiting and server errors are worth retrying; other 4xx responses are not.
+            retryable = e.status is None or e.status == 429 or e.status >= 500
+            raise EmailDeliveryError(f"Brevo error: {e.reason}", retryable=retryable)
         except Exception as e:
-            return jsonify({'message': 'Invalid or expired token!', 'error': str(e)}), 403
-        return f(*args, **kwargs)
+            raise EmailDeliveryError(f"Brevo request failed: {e}")
+        finally:
+            track_time('brevo', started)
+
+class MemoryTransport:
+    """Local stand-in for Brevo that records messages instead of sending them."""
+
+    def __init__(self):
+        self.sent = []
+        self.fail_with = None  # Set to an EmailDeliveryError to simulate failures
+
+    def send(self, recipient_email, recipient_name, subject, html_content, text_content):
+        if self.fail_with:
+            raise self.fail_with
+        self.sent.append({'to': recipient_email, 'name': recipient_name, 'subject': subject, 'html': html_content, 'text': text_content})
+
+EMAIL_TRANSPORTS = {'brevo': BrevoTransport, 'memory': MemoryTransport}
+clients.register('email_transport', lambda: EMAIL_TRANSPORTS[os.getenv("EMAIL_TRANSPORT", "brevo")]())
+
+def get_email_transport():
+    return clients.get('email_transport')
+
+def set_email_transport(transport):
+    clients.set('email_transport', transport)
+
+def email_delivery_status(state, template, error=None):
+    return {'state': state, 'template': template, 'error': error, 'updatedAt': datetime.now(timezone.utc)}
+
+def outbox_key(application_id, idempotency_key):
+    # Header values are arbitrary text and may contain '/', so hash them; scoping by
+    # application keeps a key reused on another application from suppressing its email.
+    return hashlib.sha256(f"{application_id}:{idempotency_key}".encode()).hexdigest()
+
+def enqueue_email(writer, recipient_email, applicant_name, position, status, interview_start_time=None, interview_end_time=None, application_id=None, idempotency_key=None):
+    """Adds an outbox message to a batch or transaction and returns its key."""
+    key = idempotency_key or uuid.uuid4().hex
+    writer.set(db.collection(OUTBOX_COLLECTION).document(key), {
+        'recipient': recipient_email,
+        'name': applicant_name,
+        'position': position,
+        'status': status,
+        'params': {'interviewStartTime': interview_start_time, 'interviewEndTime': interview_end_time},
+        'applicationId': application_id,
+        'state': 'pending',
+        'attempts': 0,
+        'nextAttemptAt': datetime.now(timezone.utc),
+        'lastError': None,
+        'createdAt': firestore.SERVER_TIMESTAMP,
+    })
+    return key
+
+def outbox_backoff(attempts):
+    return min(OUTBOX_BASE_BACKOFF * (2 ** (attempts - 1)), OUTBOX_MAX_BACKOFF)
+
+def record_delivery_status(application_id, status):
+    if not application_id:
+        return
+    try:
+        db.collection('applications').document(application_id).update({'emailDelivery': status})
+    except api_exceptions.NotFound:
+        pass  # The application was deleted after the email was queued
+
+def drain_outbox(limit=OUTBOX_DRAIN_BATCH):
+    """Sends up to `limit` due outbox messages and returns per-outcome counts."""
+    summary = {'sent': 0, 'retrying': 0, 'dead': 0, 'skipped': 0}
+    now = datetime.now(timezone.utc)
+    due = db.collection(OUTBOX_COLLECTION).where('state', '==', 'pending').where('nextAttemptAt', '<=', now) \
+            .order_by('nextAttemptAt').limit(limit).stream()
+    for snapshot in due:
+        message = snapshot.to_dict()
+        attempts = message.get('attempts', 0) + 1
+        try:
+            # Claim the message by pushing it past the lease; fails if another worker changed it first.
+            snapshot.reference.update({'attempts': attempts, 'nextAttemptAt': now + OUTBOX_LEASE},
+                                      option=db.write_option(last_update_time=snapshot.update_time))
+        except api_exceptions.FailedPrecondition:
+            summary['skipped'] += 1
+            continue
+
+        params = message.get('params') or {}
+        try:
+            transport = get_email_transport()
+            subject, html_content, text_content = render_email(message.get('name'), message.get('position'), message['status'],
+                                                               params.get('interviewStartTime'), params.get('interviewEndTime'))
+            transport.send(message['recipient'], message.get('name'), subject, html_content, text_content)
+        except (EmailDeliveryError, ValueError) as e:
+            # A ValueError means the message can never be rendered, so retrying is pointless.
+            if getattr(e, 'retryable', False) and attempts < OUTBOX_MAX_ATTEMPTS:
+                snapshot.reference.update({'nextAttemptAt': now + outbox_backoff(attempts), 'lastError': str(e)})
+                record_delivery_status(message.get('applicationId'), email_delivery_status('retrying', message['status'], str(e)))
+                summary['retrying'] += 1
+            else:
+                snapshot.reference.update({'state': 'dead', 'lastError': str(e)})
+                record_delivery_status(message.get('applicationId'), email_delivery_status('failed', message['status'], str(e)))
+                summary['dead'] += 1
+            print(f"Email to {message['recipient']} failed (attempt {attempts}): {e}")
+            continue
+
+        snapshot.reference.update({'state': 'sent', 'sentAt': firestore.SERVER_TIMESTAMP, 'lastError': None})
+        record_delivery_status(message.get('applicationId'), email_delivery_status('sent', message['status']))
+        summary['sent'] += 1
+    return summary
+
+@app.cli.command('drain-outbox')
+def drain_outbox_command():
+    """Sends every due outbox message. Run with `FLASK_APP=api/index.py flask drain-outbox`."""
+    totals = {}
+    while True:
+        summary = drain_outbox()
+        for outcome, count in summary.items():
+            totals[outcome] = totals.get(outcome, 0) + count
+        if sum(summary.values()) < OUTBOX_DRAIN_BATCH:
+            break
+    print(f"Outbox drained: {totals}")
+
+def worker_auth_required(f):
+    """Accepts an admin ID token, or the CRON_SECRET bearer token sent by scheduled jobs."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        cron_secret = os.getenv("CRON_SECRET")
+        if cron_secret and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {cron_secret}'):
+            return f(*args, **kwargs)
+        return token_required(f)(*args, **kwargs)
     return decorated_function
 
-def create_html_template(applicant_name, position, status, interview_start_time=None, interview_end_time=None):
-    subject, header_text, body_html, button_link, button_text = "", "", "", "", ""
-    closing_text = "Sincerely,"
-    team_name = "The Lifewood Recruitment Team"
-
-    if status == 'Received':
-        subject = "Your Lifewood Application Has Been Received"
-        header_text = "Application Received!"
-        body_html = f"""<p style="margin:0 0 25px 0;font-size:16px;line-height:1.7;color:#333333;">This is to confirm that we have successfully received your application for the <strong>{position}</strong> role at Lifewood.</p><p style="margin:0;font-size:16px;line-height:1.7;color:#333333;">Our hiring team is now reviewing applications and will be in touch with the next steps as soon as possible. Thank you for your interest in joining our team!</p>"""
-        button_link = "https://lifewood-ony.vercel.app/"
-        button_text = "Visit Our Website"
-
-    elif status == 'Under Review':
-        subject = "Update on Your Lifewood Application"
-        header_text = "Your Application is Under Review"
-        body_html = f"""<p style="margin:0 0 25px 0;font-size:16px;line-height:1.7;color:#333333;">This is a quick confirmation that we have received your application for the <strong>{position}</strong> role at Lifewood, and it is now under review by our hiring team.</p><p style="margin:0;font-size:16px;line-height:1.7;color:#333333;">We appreciate your patience during this process and will be in touch with the next steps as soon as we have an update. Thank you for your interest in joining our team!</p>"""
-        button_link = "https://lifewood-ony.vercel.app/"
-        button_text = "Visit Our Website"
-
-    elif status == 'Interview Scheduled':
-        subject = "Invitation to Interview with Lifewood"
-        header_text = "Invitation to Interview"
-        schedule_details = "Our team will reach out to you shortly to coordinate a time."
-        if interview_start_time and interview_end_time:
-            try:
-                start_dt = datetime.fromisoformat(interview_start_time)
-                end_dt = datetime.fromisoformat(interview_end_time)
-                date_str = start_dt.strftime('%A, %B %d, %Y')
-                start_time_str = start_dt.strftime('%I:%M %p')
-                end_time_str = end_dt.strftime('%I:%M %p')
-                schedule_details = f"We have scheduled your interview on <strong>{date_str} from {start_time_str} to {end_time_str}</strong>."
-            except (ValueError, TypeError):
-                schedule_details = f"We have scheduled your interview from {interview_start_time} to {interview_end_time}."
-        body_html = f"""<p style="margin:0 0 25px 0;font-size:16px;line-height:1.7;color:#333333;">Congratulations! We were very impressed with your application for the <strong>{position}</strong> role and would like to invite you for an interview.</p><p style="margin:0 0 25px 0;font-size:16px;line-height:1.7;color:#333333;">{schedule_details} Please confirm if this time works for you. If you need to reschedule, please reply to this email as soon as possible.</p><p style="margin:0;font-size:16px;line-height:1.7;color:#333333;">We look forward to speaking with you!</p>"""
-        button_link = f"mailto:hr@lifewood.com?subject=Regarding Interview for {position}"
-        button_text = "Confirm or Reschedule"
-        closing_text = "Best regards,"
-    
-    elif status == 'Offer Extended':
-        subject = "Exciting News: An Offer of Employment from Lifewood"
-        header_text = "A Job Offer from Lifewood"
-        body_html = f"""<p style="margin:0 0 25px 0;font-size:16px;line-height:1.7;color:#333333;">Following your recent interviews for the <strong>{position}</strong> position, we are absolutely delighted to formally extend to you an offer of employment with Lifewood!</p><p style="margin:0 0 25px 0;font-size:16px;line-height:1.7;color:#333333;">The entire team was thoroughly impressed with your skills and experience. Our Human Resources department will be sending a separate, detailed offer letter for your review, which will include information on compensation, benefits, and your proposed start date.</p><p style="margin:0;font-size:16px;line-height:1.7;color:#333333;">We are incredibly excited about the possibility of you joining us.</p>"""
-        button_link = f"mailto:hr@lifewood.com?subject=Regarding My Offer for the {position} Position"
-        button_text = "Contact HR to Discuss"
-        closing_text = "We look forward to hearing from you,"
-
-    elif status == 'Hired':
-        subject = "An Exciting Update on Your Application with Lifewood"
-        header_text = "Welcome to the Lifewood Team!"
-        body_html = f"""<p style="margin:0 0 25px 0;font-size:16px;line-height:1.7;color:#333333;">We are absolutely thrilled to inform you that your application for the <strong>{position}</strong> position at Lifewood has been <strong>successful</strong>!</p><p style="margin:0;font-size:16px;line-height:1.7;color:#333333;">Our Human Resources department will be reaching out to you within the next two business days to provide the full offer details, discuss your potential start date, and guide you through our comprehensive onboarding process.</p>"""
-        button_link = "mailto:hr@lifewood.com?subject=Regarding My Job Offer"
-        button_text = "Contact HR"
-        closing_text = "Best regards,"
-
-    elif status == 'Rejected':
-        subject = "An Update on Your Application with Lifewood"
-        header_text = "Thank You For Your Interest"
-        body_html = f"""<p style="margin:0 0 25px 0;font-size:16px;line-height:1.7;color:#333333;">Thank you again for your interest in the <strong>{position}</strong> position and for taking the time to interview with our team at Lifewood.</p><p style="margin:0;font-size:16px;line-height:1.7;color:#333333;">The selection process was exceptionally competitive, and after careful consideration, we have decided to move forward with another applicant. We will keep your application on file for future opportunities and wish you the very best in your job search.</p>"""
-        button_link = "https://lifewood-ony.vercel.app/services.html"
-        button_text = "Explore Other Roles"
-
-    html_content = f"""<!DOCTYPE html><html><head><meta charset="UTF-8"><style>@import url('https://fonts.googleapis.com/css2?family=Manrope:wght@400;700;800&display=swap');body{{font-family:'Manrope',Arial,sans-serif;}}</style></head><body style="margin:0;padding:0;background-color:#f5eedb;"><table border="0" cellpadding="0" cellspacing="0" width="100%"><tr><td style="padding:40px 20px;"><table align="center" border="0" cellpadding="0" cellspacing="0" width="600" style="border-collapse:collapse;background-color:#ffffff;border-radius:8px;box-shadow:0 4px 15px rgba(0,0,0,0.1);"><td align="center" style="padding: 30px 20px 20px 20px;"><a href="https://lifewood-ony.vercel.app/" target="_blank" style="text-decoration: none; display: inline-block;"><svg width="24" height="32" viewBox="0 0 24 42" xmlns="http://www.w3.org/2000/svg" style="vertical-align: middle; margin-right: 8px; height: 32px; width: auto;"><path d="M12 0L23.5962 10.5V31.5L12 42L0.403847 31.5V10.5L12 0Z" fill="#FFB347"/></svg><span style="font-family: 'Manrope', Arial, sans-serif; font-size: 30px; font-weight: 800; letter-spacing: -0.5px; color: #133020; vertical-align: middle;">lifewood</span></a></td></tr><tr><td style="padding:20px 40px;"><h1 style="font-size:28px;font-weight:700;color:#046241;margin:0 0 25px 0;text-align:center;">{header_text}</h1><p style="margin:0 0 15px 0;font-size:16px;line-height:1.7;color:#333333;">Dear {applicant_name},</p>{body_html}</td></tr><tr><td align="center" style="padding:10px 40px 30px 40px;"><a href="{button_link}" target="_blank" style="display:inline-block;padding:14px 35px;background-color:#FFB347;color:#133020;text-decoration:none;font-weight:700;border-radius:5px;font-size:16px;">{button_text}</a></td></tr><tr><td style="padding:0px 40px 40px 40px;"><p style="margin:0;font-size:16px;line-height:1.7;color:#333333;">{closing_text},</p><p style="margin:5px 0 0 0;font-size:16px;line-height:1.7;color:#333333;">{team_name}</p></td></tr></table></td></tr></table></body></html>"""
-    return subject, html_content
-
-def send_email(recipient_email, applicant_name, position, status, interview_start_time=None, interview_end_time=None):
-    # Load email credentials from Vercel environment variables
-    api_key = os.getenv("BREVO_API_KEY")
-    sender_email = os.getenv("EMAIL_SENDER")
-    
-    if not api_key or not sender_email:
-        print("Email credentials (BREVO_API_KEY or EMAIL_SENDER) are not set in environment variables.")
-        return False, "Server is not configured for sending emails."
-
-    configuration = sib_api_v3_sdk.Configuration()
-    configuration.api_key['api-key'] = api_key
-    api_instance = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
-    subject, html_content = create_html_template(applicant_name, position, status, interview_start_time, interview_end_time)
-    
-    sender = {"name": "The Lifewood Team", "email": sender_email}
-    to = [{"email": recipient_email, "name": applicant_name}]
-    send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(to=to, sender=sender, subject=subject, html_content=html_content)
-    
+# Status changes that send the applicant an email.
+NOTIFY_STATUSES = ['Hired', 'Rejected', 'Offer Extended', 'Interview Scheduled', 'Under Review']
+
+# --- LISTING HELPERS ---
+
+# Listings and exports order by submittedAt/__name__ descending under optional
+# equality filters. Firestore merges the per-field composite indexes in
+# firestore.indexes.json to serve any combination of those filters; deploy them
+# with `firebase deploy --only firestore:indexes` before the queries are used,
+# or they fail with FAILED_PRECONDITION.
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Firestore's special field path for the document id, used as the ordering tie-breaker.
+DOCUMENT_ID_FIELD = '__name__'
+
+# Columns returned for `fields=summary`, enough to render the list views.
+SUMMARY_FIELDS = {
+    'applications': ['firstName', 'lastName', 'email', 'position', 'status', 'rating', 'viewed', 'submittedAt'],
+    'inquiries': ['name', 'email', 'viewed', 'submittedAt'],
+}
+
+def encode_cursor(item):
+    # Opaque `after` token: the submittedAt/id pair of the last document on the page.
+    submitted_at = item.get('submittedAt')
+    payload = {'t': submitted_at.isoformat() if submitted_at else None, 'id': item['id']}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+def decode_cursor(token):
     try:
-        api_instance.send_transac_email(send_smtp_email)
-        return True, f"Status updated to '{status}' and email sent."
-    except ApiException as e:
-        print(f"Brevo API Error: {e}")
-        return False, f"Status updated, but email failed. Brevo error: {e.reason}"
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        submitted_at = datetime.fromisoformat(payload['t']) if payload.get('t') else None
+        return {'submittedAt': submitted_at, DOCUMENT_ID_FIELD: payload['id']}
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid 'after' cursor.")
+
+def parse_fields(collection_name, fields_arg):
+    if not fields_arg:
+        return None
+    if fields_arg == 'summary':
+        return list(SUMMARY_FIELDS[collection_name])
+    fields = [f.strip() for f in fields_arg.split(',') if f.strip()]
+    if not fields or not all(f.replace('_', '').isalnum() for f in fields):
+        raise ValueError("Invalid 'fields' parameter.")
+    # submittedAt is always selected because the next cursor is built from it.
+    if 'submittedAt' not in fields:
+        fields.append('submittedAt')
+    return fields
+
+def parse_bool(value):
+    if value is None:
+        return None
+    if value.lower() in ('true', '1', 'yes'):
+        return True
+    if value.lower() in ('false', '0', 'no'):
+        return False
+    raise ValueError(f"Invalid boolean value: '{value}'.")
+
+def listing_query(collection_name, filters, fields=None, submitted_from=None, submitted_before=None):
+    """Builds the newest-first query shared by the paginated listings and the exports."""
+    query = db.collection(collection_name)
+    for field, value in filters.items():
+        if value is not None:
+            query = query.where(field, '==', value)
+    if submitted_from:
+        query = query.where('submittedAt', '>=', submitted_from)
+    if submitted_before:
+        query = query.where('submittedAt', '<', submitted_before)
+    query = query.order_by('submittedAt', direction=firestore.Query.DESCENDING) \
+                 .order_by(DOCUMENT_ID_FIELD, direction=firestore.Query.DESCENDING)
+    if fields:
+        query = query.select(fields)
+    return query
+
+@app.cli.command('backfill-status')
+def backfill_status():
+    """Stores status 'Received' on applications written before apply stored it explicitly.
+
+    The `status` filter on listings and exports only matches documents that have the
+    field, so run this once with `FLASK_APP=api/index.py flask backfill-status`. Each
+    write requires the document to be unchanged since it was read; a batch that hits
+    a concurrent change is skipped and picked up by the next run. Afterwards run
+    `flask rebuild-search-index` so search results show the status too.
+    """
+    updated = skipped = 0
+    batch, pending = db.batch(), 0
+    for doc in db.collection('applications').select(['status']).stream():
+        if doc.to_dict().get('status'):
+            continue
+        batch.update(doc.reference, {'status': 'Received'}, option=db.write_option(last_update_time=doc.update_time))
+        pending += 1
+        if pending == 500:
+            updated, skipped = commit_backfill_batch(batch, pending, updated, skipped)
+            batch, pending = db.batch(), 0
+    if pending:
+        updated, skipped = commit_backfill_batch(batch, pending, updated, skipped)
+    print(f"Set status 'Received' on {updated} application(s); {skipped} changed meanwhile, rerun to cover them.")
+
+def commit_backfill_batch(batch, pending, updated, skipped):
+    try:
+        batch.commit()
+        return updated + pending, skipped
+    except api_exceptions.FailedPrecondition:
+        return updated, skipped + pending
+
+def list_collection_page(collection_name, filters, args):
+    """Returns one page of a collection ordered by newest first, plus the cursor for the next page."""
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("'limit' must be an integer.")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    fields = parse_fields(collection_name, args.get('fields'))
+
+    query = listing_query(collection_name, filters, fields)
+    if args.get('after'):
+        query = query.start_after(decode_cursor(args['after']))
+
+    # Fetch one extra document to know whether another page exists.
+    docs = list(query.limit(limit + 1).stream())
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    items = [dict(doc.to_dict(), id=doc.id) for doc in docs]
+    next_cursor = encode_cursor(items[-1]) if has_more else None
+    return {'items': items, 'nextCursor': next_cursor}
+
+# --- EXPORTS ---
+
+# Exports page through Firestore and write each page as soon as it is read, so
+# memory stays flat however many rows match.
+EXPORT_PAGE_SIZE = 500
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+EXPORT_COLUMNS = {
+    'applications': ['id', 'firstName', 'lastName', 'email', 'position', 'status', 'rating', 'age', 'degree',
+                     'startTime', 'endTime', 'resumeLink', 'uploadedResumeUrl', 'notes', 'viewed', 'submittedAt'],
+    'inquiries': ['id', 'name', 'email', 'message', 'viewed', 'submittedAt'],
+}
+
+def parse_export_date(value, end_of_range=False):
+    """Parses an ISO date or datetime (UTC if no offset). A bare `to` date includes that whole day."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date: '{value}'. Use YYYY-MM-DD or an ISO 8601 datetime.")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    if end_of_range and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+def export_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value
+
+def csv_cell(value):
+    value = str(export_value(value))
+    # Keeps spreadsheet apps from evaluating applicant-supplied text as a formula.
+    return "'" + value if value[:1] in ('=', '+', '-', '@') else value
+
+def iter_export_rows(query, columns):
+    last_doc = None
+    while True:
+        page = query.start_after(last_doc) if last_doc else query
+        docs = list(page.limit(EXPORT_PAGE_SIZE).stream())
+        for doc in docs:
+            data = dict(doc.to_dict(), id=doc.id)
+            yield [data.get(column) for column in columns]
+        if len(docs) < EXPORT_PAGE_SIZE:
+            return
+        last_doc = docs[-1]
+
+def export_collection(collection_name, filters, args):
+    """Returns a streaming CSV or NDJSON response. Parameters are validated before streaming starts."""
+    export_format = args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError("'format' must be csv or ndjson.")
+    columns = EXPORT_COLUMNS[collection_name]
+    if args.get('columns'):
+        columns = [c.strip() for c in args['columns'].split(',') if c.strip()]
+        if not columns or not all(c.replace('_', '').isalnum() for c in columns):
+            raise ValueError("Invalid 'columns' parameter.")
+    fields = [c for c in columns if c != 'id'] + ['submittedAt']
+    query = listing_query(collection_name, filters, list(dict.fromkeys(fields)),
+                          parse_export_date(args.get('from')), parse_export_date(args.get('to'), end_of_range=True))
+
+    def generate():
+        if export_format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for row in iter_export_rows(query, columns):
+                writer.writerow([csv_cell(value) for value in row])
+                if buffer.tell() > 64 * 1024:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            for row in iter_export_rows(query, columns):
+                yield json.dumps({column: export_value(value) for column, value in zip(columns, row)}, default=str) + '\n'
+
+    filename = f"{collection_name}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{export_format}"
+    return Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[export_format],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"', 'Cache-Control': 'no-store'})
+
+# --- ANALYTICS COUNTERS ---
+
+# One document per submission day (YYYY-MM-DD) holding `total`, `byStatus` and
+# `byPosition` counts. Updated in the same batch/transaction as the application
+# write, so the trends endpoint never has to scan the applications collection.
+ANALYTICS_COLLECTION = 'analytics_daily'
+TREND_STATUS_KEYS = ['Hired', 'Rejected', 'Interview Scheduled', 'Other']
+MAX_TREND_DAYS = 730
+
+def stats_day(app_data):
+    submitted_at = app_data.get('submittedAt')
+    # New submissions still carry the SERVER_TIMESTAMP sentinel; they land today.
+    if not isinstance(submitted_at, datetime):
+        return datetime.utcnow().date().isoformat()
+    return submitted_at.date().isoformat()
+
+def add_stats_delta(deltas, app_data, sign):
+    counts = deltas.setdefault(stats_day(app_data), {})
+    keys = [('total',), ('byStatus', app_data.get('status') or 'Received'), ('byPosition', app_data.get('position') or 'Unspecified')]
+    for key in keys:
+        counts[key] = counts.get(key, 0) + sign
+
+def stats_payload(day, counts, increment=True):
+    payload = {'date': day}
+    for key, amount in counts.items():
+        if increment and amount == 0:
+            continue
+        value = firestore.Increment(amount) if increment else amount
+        if len(key) == 1:
+            payload[key[0]] = value
+        else:
+            payload.setdefault(key[0], {})[key[1]] = value
+    return payload
+
+def write_stats_deltas(writer, deltas):
+    """Adds the counter increments to a batch or transaction."""
+    for day, counts in deltas.items():
+        payload = stats_payload(day, counts)
+        if len(payload) > 1:
+            writer.set(db.collection(ANALYTICS_COLLECTION).document(day), payload, merge=True)
+
+def trend_bucket(day, group_by):
+    if group_by == 'week':
+        return (day - timedelta(days=day.weekday())).isoformat()
+    if group_by == 'month':
+        return day.strftime('%Y-%m')
+    return day.isoformat()
+
+@app.cli.command('rebuild-analytics')
+def rebuild_analytics():
+    """Recomputes every daily analytics document from the applications collection.
+
+    Run with `FLASK_APP=api/index.py flask rebuild-analytics`. Applications written
+    while the rebuild runs may be counted twice or not at all, so run it while idle.
+    """
+    deltas = {}
+    for doc in db.collection('applications').select(['submittedAt', 'status', 'position']).stream():
+        app_data = doc.to_dict()
+        if isinstance(app_data.get('submittedAt'), datetime):
+            add_stats_delta(deltas, app_data, 1)
+    stale = [doc.reference for doc in db.collection(ANALYTICS_COLLECTION).select([]).stream() if doc.id not in deltas]
+
+    batch, pending = db.batch(), 0
+    for day, counts in deltas.items():
+        batch.set(db.collection(ANALYTICS_COLLECTION).document(day), stats_payload(day, counts, increment=False))
+        pending += 1
+        if pending == 500:
+            batch.commit()
+            batch, pending = db.batch(), 0
+    for ref in stale:
+        batch.delete(ref)
+        pending += 1
+        if pending == 500:
+            batch.commit()
+            batch, pending = db.batch(), 0
+    if pending:
+        batch.commit()
+    print(f"Rebuilt {len(deltas)} daily analytics documents, removed {len(stale)} stale ones.")
+
+# --- SEARCH INDEX ---
+
+# search_index/<app_id> mirrors each application's searchable text as a `terms`
+# array (every token plus its prefixes, for prefix matching) and a `weights`
+# map used for ranking, along with the summary the results list shows. A query
+# reads only the index documents containing its most selective term, so its
+# cost follows the number of matches rather than the size of the collection.
+# Only `terms` is indexed: firestore.indexes.json exempts `weights` and `summary`,
+# which would otherwise add an index entry per map key. Ranking happens on at
+# most MAX_SEARCH_CANDIDATES documents; past that the response says
+# `truncated: true, ranked: false`, `total` is a lower bound, and the order is
+# only by score among whichever candidates Firestore returned first.
+SEARCH_COLLECTION = 'search_index'
+SEARCH_FIELD_WEIGHTS = {'firstName': 3, 'lastName': 3, 'email': 3, 'position': 2, 'degree': 1, 'notes': 1}
+SEARCH_SUMMARY_FIELDS = ['firstName', 'lastName', 'email', 'position', 'status', 'submittedAt']
+MIN_PREFIX_LENGTH = 2
+MAX_TERM_LENGTH = 20
+# Free-text fields can hold hundreds of words; only the first distinct ones are indexed.
+MAX_FIELD_TOKENS = 50
+MAX_SEARCH_CANDIDATES = 1000
+
+def search_tokens(text):
+    # Drops combining marks so 'José' and 'jose' match while other scripts are kept
+    # as they are, then splits on anything that is not a word character.
+    decomposed = unicodedata.normalize('NFKD', str(text)).casefold()
+    folded = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return [token[:MAX_TERM_LENGTH] for token in re.findall(r'\w+', folded)]
+
+def search_document(app_data):
+    weights = {}
+    for field, weight in SEARCH_FIELD_WEIGHTS.items():
+        for token in list(dict.fromkeys(search_tokens(app_data.get(field) or '')))[:MAX_FIELD_TOKENS]:
+            weights[token] = max(weights.get(token, 0), weight)
+            # Prefixes score half, so exact matches rank first.
+            for length in range(MIN_PREFIX_LENGTH, len(token)):
+                weights[token[:length]] = max(weights.get(token[:length], 0), weight / 2)
+    summary = {field: app_data.get(field) for field in SEARCH_SUMMARY_FIELDS if field in app_data}
+    return {'terms': sorted(weights), 'weights': weights, 'summary': summary,
+            'submittedAt': app_data.get('submittedAt')}
+
+def index_application(writer, app_ref, app_data):
+    """Adds the index update for an application to a batch or transaction."""
+    writer.set(db.collection(SEARCH_COLLECTION).document(app_ref.id), search_document(app_data))
+
+def unindex_application(writer, app_ref):
+    writer.delete(db.collection(SEARCH_COLLECTION).document(app_ref.id))
+
+def search_applications(query_text, limit, offset):
+    # Whole words are always indexed, so a single Chinese or Japanese character
+    # can be searched; single Latin letters would only match one-letter words.
+    tokens = [t for t in dict.fromkeys(search_tokens(query_text)) if len(t) >= MIN_PREFIX_LENGTH or not t.isascii()]
+    if not tokens:
+        raise ValueError(f"'q' must contain at least one word of {MIN_PREFIX_LENGTH} or more characters.")
+    anchor = tokens[0]
+    if len(tokens) > 1:
+        # Length says little about selectivity ('gmail' is in most documents), so
+        # the anchor is the term with the fewest index entries. Each count is one
+        # aggregation read per MAX_SEARCH_CANDIDATES entries, and stops there.
+        counts = {}
+        for token in tokens:
+            query = db.collection(SEARCH_COLLECTION).where('terms', 'array_contains', token).limit(MAX_SEARCH_CANDIDATES)
+            counts[token] = query.count().get()[0][0].value
+            if counts[token] == 0:
+                break
+        anchor = min(counts, key=counts.get)
+        if counts[anchor] == 0:
+            return {'items': [], 'total': 0, 'truncated': False, 'ranked': True, 'nextCursor': None}
+    # The other terms are checked on the anchor's matches.
+    candidates = db.collection(SEARCH_COLLECTION).where('terms', 'array_contains', anchor) \
+                   .select(['weights', 'summary', 'submittedAt']).limit(MAX_SEARCH_CANDIDATES).stream()
+    matches = []
+    scanned = 0
+    for doc in candidates:
+        scanned += 1
+        entry = doc.to_dict()
+        weights = entry.get('weights', {})
+        if all(token in weights for token in tokens):
+            matches.append((sum(weights[token] for token in tokens), entry.get('submittedAt'), doc.id, entry.get('summary', {})))
+    # Highest score first, newest first among equal scores.
+    matches.sort(key=lambda m: (m[0], m[1].timestamp() if isinstance(m[1], datetime) else 0), reverse=True)
+    page = matches[offset:offset + limit]
+    items = [dict(summary, id=app_id, score=score) for score, _, app_id, summary in page]
+    # A full candidate page means more documents contain the anchor term than were read.
+    truncated = scanned >= MAX_SEARCH_CANDIDATES
+    return {'items': items, 'total': len(matches), 'truncated': truncated, 'ranked': not truncated,
+            'nextCursor': str(offset + limit) if offset + limit < len(matches) else None}
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index():
+    """Re-indexes every application. Run with `FLASK_APP=api/index.py flask rebuild-search-index`."""
+    indexed = set()
+    batch, pending = db.batch(), 0
+    for doc in db.collection('applications').stream():
+        index_application(batch, doc.reference, doc.to_dict())
+        indexed.add(doc.id)
+        pending += 1
+        if pending == 500:
+            batch.commit()
+            batch, pending = db.batch(), 0
+    stale = [doc.reference for doc in db.collection(SEARCH_COLLECTION).select([]).stream() if doc.id not in indexed]
+    for ref in stale:
+        batch.delete(ref)
+        pending += 1
+        if pending == 500:
+            batch.commit()
+            batch, pending = db.batch(), 0
+    if pending:
+        batch.commit()
+    print(f"Indexed {len(indexed)} applications, removed {len(stale)} stale index entries.")
+
+# --- RESUME UPLOADS ---
+
+# Browsers upload resumes straight to the bucket through a resumable session
+# created by /api/apply/resume-upload, and /api/apply only records the object
+# path. Posting the file to /api/apply is kept as a fallback and is streamed to
+# the bucket in chunks.
+#
+# Direct uploads land privately under RESUME_UPLOAD_PREFIX, where a lifecycle
+# rule (`flask configure-storage`) deletes them after a day. Only once apply has
+# validated one is it copied under RESUME_PREFIX and made public, so uploads no
+# application references are never readable.
+RESUME_CONTENT_TYPES = {
+    'application/pdf',
+    'application/msword',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+}
+MAX_RESUME_BYTES = 10 * 1024 * 1024
+RESUME_UPLOAD_PREFIX = 'resumes/uploads/'
+RESUME_PREFIX = 'resumes/'
+RESUME_UPLOAD_MAX_AGE_DAYS = 1
+RESUME_CHUNK_SIZE = 1024 * 1024  # GCS requires a multiple of 256 KiB
+# Rejects oversized fallback uploads before Werkzeug spools them; leaves room for the form fields.
+app.config['MAX_CONTENT_LENGTH'] = MAX_RESUME_BYTES + 1024 * 1024
+
+def resume_object_name(filename, prefix=RESUME_PREFIX):
+    safe_name = re.sub(r'[^A-Za-z0-9._-]', '_', os.path.basename(filename or ''))[-100:] or 'resume'
+    return f"{prefix}{uuid.uuid4().hex}/{safe_name}"
+
+def validate_resume(content_type, size):
+    if content_type not in RESUME_CONTENT_TYPES:
+        raise ValueError("Resume must be a PDF or Word document.")
+    if not isinstance(size, int) or not 0 < size <= MAX_RESUME_BYTES:
+        raise ValueError(f"Resume must be smaller than {MAX_RESUME_BYTES // (1024 * 1024)} MB.")
+
+def check_uploaded_resume(blob):
+    """Validates an object after it reached the bucket and deletes it if it is not acceptable."""
+    try:
+        validate_resume(blob.content_type, blob.size)
+    except ValueError:
+        blob.delete()
+        raise
+    return blob
+
+def verify_direct_upload(resume_path):
+    if not resume_path.startswith(RESUME_UPLOAD_PREFIX) or '..' in resume_path:
+        raise ValueError("Invalid resume upload.")
+    blob = bucket.get_blob(resume_path)
+    if blob is None:
+        raise ValueError("Resume upload was not found. Please upload it again.")
+    check_uploaded_resume(blob)
+    # The private upload is left for the lifecycle rule to remove.
+    published = bucket.copy_blob(blob, bucket, resume_object_name(resume_path))
+    published.make_public()
+    return published
+
+def discard_resume(blob):
+    """Deletes a published resume whose application was not stored."""
+    try:
+        blob.delete()
+    except Exception as e:
+        print(f"Could not delete orphaned resume {blob.name}: {e}")
+
+def stream_resume_upload(file):
+    if file.mimetype not in RESUME_CONTENT_TYPES:
+        raise ValueError("Resume must be a PDF or Word document.")
+    blob = bucket.blob(resume_object_name(file.filename))
+    # A chunk size makes the client use a resumable upload, sent one chunk at a time.
+    blob.chunk_size = RESUME_CHUNK_SIZE
+    blob.upload_from_file(file.stream, content_type=file.mimetype, predefined_acl='publicRead')
+    return check_uploaded_resume(blob)
+
+@app.cli.command('configure-storage')
+def configure_storage():
+    """Adds the lifecycle rule that expires unclaimed direct uploads. Run with `FLASK_APP=api/index.py flask configure-storage`."""
+    bucket.reload()
+    for rule in bucket.lifecycle_rules:
+        if rule.get('action', {}).get('type') == 'Delete' and RESUME_UPLOAD_PREFIX in rule.get('condition', {}).get('matchesPrefix', []):
+            print(f"Lifecycle rule for {RESUME_UPLOAD_PREFIX} already present.")
+            return
+    bucket.add_lifecycle_delete_rule(age=RESUME_UPLOAD_MAX_AGE_DAYS, matches_prefix=[RESUME_UPLOAD_PREFIX])
+    bucket.patch()
+    print(f"Objects under {RESUME_UPLOAD_PREFIX} now expire after {RESUME_UPLOAD_MAX_AGE_DAYS} day(s).")
+
+# --- PUBLIC POSITIONS CACHE ---
+
+# Every careers page visit lists the positions, which rarely change. Each warm
+# instance keeps the serialized list for a short TTL, and add/delete invalidate
+# it. Browsers revalidate with the ETag, and Vercel's edge can serve it for s-maxage.
+POSITIONS_CACHE_TTL = 60  # seconds
+POSITIONS_CACHE_CONTROL = 'public, max-age=0, must-revalidate, s-maxage=60, stale-while-revalidate=300'
+_positions_cache = {'body': None, 'etag': None, 'expires': 0.0, 'generation': 0}
+_positions_lock = threading.Lock()
+
+def cached_positions():
+    """Returns the serialized positions list and its ETag, reloading it once the TTL has passed."""
+    with _positions_lock:
+        if _positions_cache['body'] is not None and _positions_cache['expires'] > time.monotonic():
+            return _positions_cache['body'], _positions_cache['etag']
+        generation = _positions_cache['generation']
+    positions_ref = db.collection('positions').order_by('title').stream()
+    body = json.dumps([dict(doc.to_dict(), id=doc.id) for doc in positions_ref], default=str)
+    etag = hashlib.sha256(body.encode()).hexdigest()[:32]
+    with _positions_lock:
+        # An add/delete during the read bumps the generation; the list read here
+        # may predate it, so it is served once but not cached.
+        if _positions_cache['generation'] == generation:
+            _positions_cache.update(body=body, etag=etag, expires=time.monotonic() + POSITIONS_CACHE_TTL)
+    return body, etag
+
+def invalidate_positions_cache():
+    with _positions_lock:
+        _positions_cache.update(body=None, etag=None, expires=0.0, generation=_positions_cache['generation'] + 1)
+
+# --- SUBMISSION GUARDS ---
+
+# The public forms are unauthenticated. Token buckets per client IP and per
+# email throttle bots, and a repeated submission (double click, retry, replay)
+# gets the original response back instead of writing, uploading and emailing
+# again. Idempotency records expire after a day; the TTL policy on
+# `submission_keys.expiresAt` in firestore.indexes.json removes them.
+RATE_LIMITS = {
+    # scope: {bucket key: (burst capacity, seconds to refill the whole bucket)}
+    'apply': {'ip': (20, 600), 'email': (5, 3600)},
+    'resume_upload': {'ip': (20, 600)},
+    'inquiry': {'ip': (10, 600), 'email': (3, 3600)},
+}
+IDEMPOTENCY_COLLECTION = 'submission_keys'
+IDEMPOTENCY_WINDOW = timedelta(hours=24)
+
+class MemoryRateLimitBackend:
+    """Token buckets kept in process memory, so each warm instance limits on its own."""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill_per_second):
+        """Spends a token; returns 0 when allowed, else the seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / refill_per_second
+            self._buckets[key] = (tokens - 1 if not wait else tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return wait
+
+RATE_LIMIT_BACKENDS = {'memory': MemoryRateLimitBackend}
+clients.register('rate_limit_backend', lambda: RATE_LIMIT_BACKENDS[os.getenv("RATE_LIMIT_BACKEND", "memory")]())
+
+def get_rate_limit_backend():
+    return clients.get('rate_limit_backend')
+
+def set_rate_limit_backend(backend):
+    clients.set('rate_limit_backend', backend)
+
+def client_ip():
+    # Vercel's proxy puts the real client address first in X-Forwarded-For.
+    forwarded = request.headers.get('X-Forwarded-For', '').split(',')[0].strip()
+    return forwarded or request.remote_addr or 'unknown'
+
+def normalize_submission_value(value):
+    return ' '.join(str(value or '').lower().split())
+
+def rate_limited(scope):
+    """Answers 429 with Retry-After once the caller's IP or email bucket for `scope` is empty."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            payload = (request.get_json(silent=True) if request.is_json else request.form) or {}
+            keys = {'ip': client_ip(), 'email': normalize_submission_value(payload.get('email'))}
+            backend = get_rate_limit_backend()
+            wait = 0.0
+            for kind, (capacity, period) in RATE_LIMITS[scope].items():
+                if keys[kind]:
+                    wait = max(wait, backend.take(f"{scope}:{kind}:{keys[kind]}", capacity, capacity / period))
+            if wait:
+                response = jsonify({"message": "Too many submissions. Please try again later."})
+                response.headers['Retry-After'] = str(int(wait) + 1)
+                return response, 429
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+def submission_key(scope, *parts):
+    """The idempotency record id: from the client's Idempotency-Key header, else from the normalized `parts`."""
+    client_key = request.headers.get('Idempotency-Key', '').strip()
+    source = f"{scope}:key:{client_key}" if client_key else ':'.join([scope] + [normalize_submission_value(p) for p in parts])
+    return hashlib.sha256(source.encode()).hexdigest()
+
+def previous_submission(key):
+    """Returns the record's snapshot and, while it has not expired, the stored response."""
+    snapshot = db.collection(IDEMPOTENCY_COLLECTION).document(key).get()
+    record = snapshot.to_dict() if snapshot.exists else None
+    if record and record.get('expiresAt') and record['expiresAt'] > datetime.now(timezone.utc):
+        return snapshot, record
+    return snapshot, None
+
+def record_submission(writer, snapshot, status_code, body, document_id):
+    """Adds the idempotency record to the submission's batch; a concurrent duplicate then fails the commit."""
+    now = datetime.now(timezone.utc)
+    record = {'statusCode': status_code, 'body': body, 'documentId': document_id,
+              'createdAt': now, 'expiresAt': now + IDEMPOTENCY_WINDOW}
+    if snapshot.exists:
+        # Replace the expired record only if nobody else has in the meantime.
+        writer.update(snapshot.reference, record, option=db.write_option(last_update_time=snapshot.update_time))
+    else:
+        writer.create(snapshot.reference, record)
+
+def replay_submission(record):
+    response = jsonify(record['body'])
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response, record['statusCode']
+
+def commit_submission(batch, key):
+    """Commits the batch. Returns None, or the winner's stored response if a concurrent duplicate got there first."""
+    try:
+        batch.commit()
+        return None
+    except (api_exceptions.AlreadyExists, api_exceptions.FailedPrecondition):
+        _, previous = previous_submission(key)
+        if previous is None:
+            raise
+        return replay_submission(previous)
 
 # --- PUBLIC ROUTES ---
 
+@app.route('/api/apply/resume-upload', methods=['POST'])
+@rate_limited('resume_upload')
+def create_resume_upload():
+    try:
+        data = request.get_json() or {}
+        content_type = data.get('contentType')
+        size = data.get('size')
+        validate_resume(content_type, size)
+        blob = bucket.blob(resume_object_name(data.get('filename'), RESUME_UPLOAD_PREFIX))
+        # The session only accepts exactly `size` bytes of `content_type`, and only from the caller's origin.
+        # The object stays private until an application claims it.
+        upload_url = blob.create_resumable_upload_session(
+            content_type=content_type, size=size, origin=request.headers.get('Origin')
+        )
+        return jsonify({"uploadUrl": upload_url, "resumePath": blob.name}), 201
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    except Exception as e:
+        print(f"Error in /api/apply/resume-upload: {e}")
+        return jsonify({"message": "Could not start the resume upload."}), 500
+
 @app.route('/api/apply', methods=['POST'])
+@rate_limited('apply')
 def apply():
+    blob = None
     try:
         data = request.form.to_dict()
         data['submittedAt'] = firestore.SERVER_TIMESTAMP
         data['viewed'] = False  # Mark as unread for notification feature
+        data['status'] = 'Received'  # Stored explicitly so listings can filter on it
         required_fields = ['firstName', 'lastName', 'email', 'position', 'age', 'degree']
         if any(field not in data or not data[field] for field in required_fields):
             return jsonify({"message": "Missing required fields."}), 400
-        
-        if 'resumeFile' in request.files:
-            file = request.files['resumeFile']
-            if file.filename != '':
-                blob = bucket.blob(f"resumes/{data['lastName']}_{data['firstName']}_{datetime.now().timestamp()}_{file.filename}")
-                blob.upload_from_file(file)
-                blob.make_public()
-                data['uploadedResumeUrl'] = blob.public_url
-
-        db.collection('applications').add(data)
-        send_email(data.get('email'), data.get('firstName'), data.get('position'), 'Received')
-        return jsonify({"message": "Application submitted successfully."}), 201
+
+        # Checked before the upload so a duplicate costs one read and nothing else.
+        key = submission_key('apply', data['email'], data['position'])
+        submission, previous = previous_submission(key)
+        if previous:
+            return replay_submission(previous)
+
+        if data.get('resumePath'):
+            blob = verify_direct_upload(data['resumePath'])
+        elif 'resumeFile' in request.files and request.files['resumeFile'].filename != '':
+            blob = stream_resume_upload(request.files['resumeFile'])
+        if blob is not None:
+            data['resumePath'] = blob.name
+            data['uploadedResumeUrl'] = blob.public_url
+
+        app_ref = db.collection('applications').document()
+        data['emailDelivery'] = email_delivery_status('queued', 'Received')
+        deltas = {}
+        add_stats_delta(deltas, data, 1)
+        batch = db.batch()
+        batch.set(app_ref, data)
+        write_stats_deltas(batch, deltas)
+        index_application(batch, app_ref, data)
+        enqueue_email(batch, data.get('email'), data.get('firstName'), data.get('position'), 'Received',
+                      application_id=app_ref.id, idempotency_key=f"{app_ref.id}-received")
+        body = {"message": "Application submitted successfully."}
+        record_submission(batch, submission, 201, body, app_ref.id)
+        replayed = commit_submission(batch, key)
+        if replayed is not None:
+            if blob is not None:
+                discard_resume(blob)
+            return replayed
+        return jsonify(body), 201
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
     except Exception as e:
         print(f"Error in /api/apply: {e}")
+        if blob is not None:
+            discard_resume(blob)
         return jsonify({"message": "Could not submit application due to a server error."}), 500
 
 @app.route('/api/positions', methods=['GET'])
 def get_public_positions():
     try:
-        positions_ref = db.collection('positions').order_by('title').stream()
-        return jsonify([dict(doc.to_dict(), id=doc.id) for doc in positions_ref]), 200
+        body, etag = cached_positions()
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = POSITIONS_CACHE_CONTROL
+        # Answers If-None-Match with an empty 304 Not Modified.
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({"message": "Could not retrieve positions."}), 500
 
 @app.route('/api/inquiries', methods=['POST'])
+@rate_limited('inquiry')
 def submit_inquiry():
     try:
         data = request.get_json()
         if not all(k in data for k in ('name', 'email', 'message')):
             return jsonify({'message': 'Missing required fields.'}), 400
-        
+
+        key = submission_key('inquiry', data['email'], data['message'])
+        submission, previous = previous_submission(key)
+        if previous:
+            return replay_submission(previous)
+
         data['submittedAt'] = firestore.SERVER_TIMESTAMP
         data['viewed'] = False # Mark as unread for notification feature
-        db.collection('inquiries').add(data)
-        return jsonify({'message': 'Inquiry submitted successfully!'}), 201
+        inquiry_ref = db.collection('inquiries').document()
+        body = {'message': 'Inquiry submitted successfully!'}
+        batch = db.batch()
+        batch.set(inquiry_ref, data)
+        record_submission(batch, submission, 201, body, inquiry_ref.id)
+        return commit_submission(batch, key) or (jsonify(body), 201)
     except Exception as e:
         return jsonify({'message': 'Could not submit inquiry.'}), 500
 
 # --- ADMIN ROUTES ---
 
+@app.route('/api/_metrics', methods=['GET'])
+@token_required
+def get_metrics():
+    return jsonify(dict(route_metrics.snapshot(), tokenCache=token_cache.stats(), startup=startup_timings)), 200
+
 @app.route('/api/analytics/application-trends', methods=['GET'])
 @token_required
 def get_application_trends():
     try:
+        days = int(request.args.get('days', 7))
+        group_by = request.args.get('groupBy', 'day')
+        if not 1 <= days <= MAX_TREND_DAYS or group_by not in ('day', 'week', 'month'):
+            return jsonify({"message": f"'days' must be 1-{MAX_TREND_DAYS} and 'groupBy' one of day, week, month."}), 400
+
         today = datetime.utcnow().date()
-        seven_days_ago = today - timedelta(days=6)
-        apps_ref = db.collection('applications').where('submittedAt', '>=', datetime.combine(seven_days_ago, datetime.min.time())).stream()
-        
-        labels = [(seven_days_ago + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(7)]
-        status_keys = ['Hired', 'Rejected', 'Interview Scheduled', 'Other']
-        counts_by_day = {day: {status: 0 for status in status_keys} for day in labels}
+        start_day = today - timedelta(days=days - 1)
+        labels = list(dict.fromkeys(trend_bucket(start_day + timedelta(days=i), group_by) for i in range(days)))
+        counts_by_label = {label: {status: 0 for status in TREND_STATUS_KEYS} for label in labels}
+        counts_by_position = {}
 
-        for app in apps_ref:
-            app_data = app.to_dict()
-            if app_data.get('submittedAt'):
-                submitted_date_str = app_data['submittedAt'].date().strftime('%Y-%m-%d')
-                if submitted_date_str in counts_by_day:
-                    status = app_data.get('status', 'Received')
-                    status_key = status if status in status_keys else 'Other'
-                    counts_by_day[submitted_date_str][status_key] += 1
-        
-        datasets = [{"label": status, "data": [counts_by_day[day][status] for day in labels]} for status in status_keys]
-        return jsonify({'labels': labels, 'datasets': datasets}), 200
+        stats_ref = db.collection(ANALYTICS_COLLECTION).where('date', '>=', start_day.isoformat()).where('date', '<=', today.isoformat()).stream()
+        for doc in stats_ref:
+            stats = doc.to_dict()
+            label = trend_bucket(date.fromisoformat(stats['date']), group_by)
+            for status, count in stats.get('byStatus', {}).items():
+                status_key = status if status in TREND_STATUS_KEYS else 'Other'
+                counts_by_label[label][status_key] += count
+            for position, count in stats.get('byPosition', {}).items():
+                counts_by_position[position] = counts_by_position.get(position, 0) + count
+
+        datasets = [{"label": status, "data": [counts_by_label[label][status] for label in labels]} for status in TREND_STATUS_KEYS]
+        positions = {position: count for position, count in counts_by_position.items() if count}
+        return jsonify({'labels': labels, 'datasets': datasets, 'positions': positions}), 200
+    except ValueError:
+        return jsonify({"message": "'days' must be an integer."}), 400
     except Exception as e:
         return jsonify({"message": "Could not retrieve application trends."}), 500
 
@@ -254,6 +1563,48 @@ def get_application(app_id):
         return jsonify(dict(doc.to_dict(), id=doc.id)), 200
     except Exception as e: return jsonify({"message": f"An error occurred: {e}"}), 500
 
+def run_transaction(function, *args):
+    # Wrapped at call time so importing this module does not load the Firestore SDK.
+    return firestore.transactional(function)(db.transaction(), *args)
+
+def update_application_transaction(transaction, app_ref, data_to_update, idempotency_key=None):
+    snapshot = app_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return None
+    before = snapshot.to_dict()
+    after = dict(before, **data_to_update)
+    new_status = data_to_update.get('status')
+    notify = new_status in NOTIFY_STATUSES
+    if notify and idempotency_key:
+        # A retried request with the same key must not queue the email twice.
+        notify = not db.collection(OUTBOX_COLLECTION).document(idempotency_key).get(transaction=transaction).exists
+    if notify:
+        enqueue_email(transaction, after.get('email'), after.get('firstName'), after.get('position'), new_status,
+                      data_to_update.get('interviewStartTime'), data_to_update.get('interviewEndTime'),
+                      application_id=app_ref.id, idempotency_key=idempotency_key)
+        transaction.update(app_ref, dict(data_to_update, emailDelivery=email_delivery_status('queued', new_status)))
+    else:
+        transaction.update(app_ref, data_to_update)
+    if (before.get('status') or 'Received') != (after.get('status') or 'Received'):
+        deltas = {}
+        add_stats_delta(deltas, before, -1)
+        add_stats_delta(deltas, after, 1)
+        write_stats_deltas(transaction, deltas)
+    if any(field in data_to_update for field in ('status', 'notes')):
+        index_application(transaction, app_ref, after)
+    return after
+
+def delete_application_transaction(transaction, app_ref):
+    snapshot = app_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return False
+    transaction.delete(app_ref)
+    unindex_application(transaction, app_ref)
+    deltas = {}
+    add_stats_delta(deltas, snapshot.to_dict(), -1)
+    write_stats_deltas(transaction, deltas)
+    return True
+
 @app.route('/api/application/<app_id>', methods=['PUT'])
 @token_required
 def update_application(app_id):
@@ -263,19 +1614,18 @@ def update_application(app_id):
         data_to_update = {k: v for k, v in data.items() if k in valid_fields}
 
         if not data_to_update: return jsonify({"message": "No valid fields provided."}), 400
-        
+        data_to_update.update(audit_fields())
+
         app_ref = db.collection('applications').document(app_id)
-        app_ref.update(data_to_update)
+        idempotency_key = request.headers.get('Idempotency-Key')
+        app_data = run_transaction(update_application_transaction, app_ref, data_to_update,
+                                   outbox_key(app_id, idempotency_key) if idempotency_key else None)
+        if app_data is None: return jsonify({"message": "Application not found."}), 404
 
         if 'status' in data_to_update:
             new_status = data_to_update['status']
-            app_data = app_ref.get().to_dict()
-            if new_status in ['Hired', 'Rejected', 'Offer Extended', 'Interview Scheduled', 'Under Review']:
-                success, message = send_email(
-                    app_data.get('email'), app_data.get('firstName'), app_data.get('position'), 
-                    new_status, data.get('interviewStartTime'), data.get('interviewEndTime')
-                )
-                return jsonify({"message": message}), 200 if success else 500
+            if new_status in NOTIFY_STATUSES:
+                return jsonify({"message": f"Status updated to '{new_status}' and email queued."}), 200
             return jsonify({"message": f"Status updated to '{new_status}'."}), 200
         
         return jsonify({"message": "Application updated successfully."}), 200
@@ -286,7 +1636,10 @@ def update_application(app_id):
 @token_required
 def delete_application(app_id):
     try:
-        db.collection('applications').document(app_id).delete()
+        app_ref = db.collection('applications').document(app_id)
+        if not run_transaction(delete_application_transaction, app_ref):
+            return jsonify({"message": "Application not found."}), 404
+        print(f"Application {app_id} deleted by {current_admin()}")
         return jsonify({"message": "Application deleted."}), 200
     except Exception as e: return jsonify({"message": f"Could not delete application: {e}"}), 500
 
@@ -294,10 +1647,126 @@ def delete_application(app_id):
 @token_required
 def get_applications():
     try:
-        apps_ref = db.collection('applications').order_by('submittedAt', direction=firestore.Query.DESCENDING).stream()
-        return jsonify([dict(doc.to_dict(), id=doc.id) for doc in apps_ref]), 200
+        filters = {
+            'status': request.args.get('status'),
+            'position': request.args.get('position'),
+            'viewed': parse_bool(request.args.get('viewed')),
+        }
+        return jsonify(list_collection_page('applications', filters, request.args)), 200
+    except ValueError as e: return jsonify({"message": str(e)}), 400
     except Exception as e: return jsonify({"message": f"Could not retrieve applications: {e}"}), 500
 
+BULK_OPERATIONS = {'delete', 'status', 'rating'}
+MAX_BULK_IDS = 500
+# Each application can cost four writes (itself, a daily stats document, an
+# outbox message and its search entry), which keeps every batch under
+# Firestore's 500-write limit.
+BULK_CHUNK_SIZE = 120
+
+@app.route('/api/applications/search', methods=['GET'])
+@token_required
+def search_applications_endpoint():
+    try:
+        limit = max(1, min(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+        offset = max(0, int(request.args.get('after', 0)))
+    except ValueError:
+        return jsonify({"message": "'limit' and 'after' must be integers."}), 400
+    try:
+        return jsonify(search_applications(request.args.get('q', ''), limit, offset)), 200
+    except ValueError as e: return jsonify({"message": str(e)}), 400
+    except Exception as e: return jsonify({"message": f"Could not search applications: {e}"}), 500
+
+@app.route('/api/applications/bulk', methods=['POST'])
+@token_required
+def bulk_update_applications():
+    try:
+        data = request.get_json() or {}
+        ids = data.get('ids')
+        operation = data.get('operation')
+        if not isinstance(ids, list) or not ids or not all(isinstance(i, str) and i for i in ids):
+            return jsonify({"message": "'ids' must be a non-empty list of application ids."}), 400
+        if len(ids) > MAX_BULK_IDS:
+            return jsonify({"message": f"At most {MAX_BULK_IDS} ids can be processed per request."}), 400
+        if operation not in BULK_OPERATIONS:
+            return jsonify({"message": f"'operation' must be one of: {', '.join(sorted(BULK_OPERATIONS))}."}), 400
+        if operation != 'delete' and 'value' not in data:
+            return jsonify({"message": "'value' is required for this operation."}), 400
+
+        ids = list(dict.fromkeys(ids))
+        refs = [db.collection('applications').document(app_id) for app_id in ids]
+        # One round trip to read every selected document instead of one per id.
+        snapshots = {snap.id: snap for snap in db.get_all(refs)}
+        notify = operation == 'status' and data['value'] in NOTIFY_STATUSES
+        results = {}
+        for i in range(0, len(refs), BULK_CHUNK_SIZE):
+            deltas = {}
+            batch = db.batch()
+            chunk_results = {}
+            for ref in refs[i:i + BULK_CHUNK_SIZE]:
+                snap = snapshots.get(ref.id)
+                if snap is None or not snap.exists:
+                    results[ref.id] = {"success": False, "message": "Application not found."}
+                    continue
+                before = snap.to_dict()
+                # The snapshot was read outside a transaction; fail the chunk rather than
+                # count a document twice if someone else changed or deleted it since.
+                unchanged = db.write_option(last_update_time=snap.update_time)
+                if operation == 'delete':
+                    batch.delete(ref, option=unchanged)
+                    unindex_application(batch, ref)
+                    add_stats_delta(deltas, before, -1)
+                    chunk_results[ref.id] = {"success": True, "message": "Application deleted."}
+                    continue
+                changes = dict(audit_fields(), **{operation: data['value']})
+                if operation == 'status':
+                    add_stats_delta(deltas, before, -1)
+                    add_stats_delta(deltas, dict(before, status=data['value']), 1)
+                    index_application(batch, ref, dict(before, status=data['value']))
+                if notify:
+                    enqueue_email(batch, before.get('email'), before.get('firstName'), before.get('position'), data['value'],
+                                  data.get('interviewStartTime'), data.get('interviewEndTime'), application_id=ref.id)
+                    changes['emailDelivery'] = email_delivery_status('queued', data['value'])
+                batch.update(ref, changes, option=unchanged)
+                chunk_results[ref.id] = {"success": True, "message": "Application updated and email queued." if notify else "Application updated."}
+            write_stats_deltas(batch, deltas)
+            try:
+                batch.commit()
+            except Exception as e:
+                # Earlier chunks stay committed, so report this chunk's ids as failed and carry on.
+                print(f"Bulk {operation} chunk failed: {e}")
+                if isinstance(e, api_exceptions.FailedPrecondition):
+                    message = "Application was changed by someone else; reload and try again."
+                else:
+                    message = f"Could not process application: {e}"
+                chunk_results = {app_id: {"success": False, "message": message} for app_id in chunk_results}
+            results.update(chunk_results)
+
+        succeeded = sum(1 for r in results.values() if r['success'])
+        print(f"Bulk {operation} on {succeeded} application(s) by {current_admin()}")
+        return jsonify({"message": f"{succeeded} of {len(ids)} application(s) processed.", "results": results}), 200
+    except Exception as e:
+        return jsonify({"message": f"Could not process bulk request: {e}"}), 500
+
+@app.route('/api/outbox/drain', methods=['GET', 'POST'])
+@worker_auth_required
+def drain_email_outbox():
+    try:
+        limit = max(1, min(int(request.args.get('limit', OUTBOX_DRAIN_BATCH)), 200))
+        return jsonify(drain_outbox(limit)), 200
+    except ValueError:
+        return jsonify({"message": "'limit' must be an integer."}), 400
+    except Exception as e:
+        return jsonify({"message": f"Could not drain email outbox: {e}"}), 500
+
+@app.route('/api/applications/export', methods=['GET'])
+@token_required
+def export_applications():
+    try:
+        filters = {'status': request.args.get('status'), 'position': request.args.get('position')}
+        return export_collection('applications', filters, request.args)
+    except ValueError as e: return jsonify({"message": str(e)}), 400
+    except Exception as e: return jsonify({"message": f"Could not export applications: {e}"}), 500
+
 @app.route('/api/applications/mark-as-read', methods=['POST'])
 @token_required
 def mark_applications_as_read():
@@ -315,6 +1784,7 @@ def add_position():
     try:
         data = request.get_json()
         db.collection('positions').add(data)
+        invalidate_positions_cache()
         return jsonify({"message": "Position added."}), 201
     except Exception as e: return jsonify({"message": "Could not add position."}), 500
 
@@ -323,6 +1793,7 @@ def add_position():
 def delete_position(position_id):
     try:
         db.collection('positions').document(position_id).delete()
+        invalidate_positions_cache()
         return jsonify({"message": "Position deleted."}), 200
     except Exception as e: return jsonify({"message": "Could not delete position."}), 500
     
@@ -330,10 +1801,20 @@ def delete_position(position_id):
 @token_required
 def get_inquiries():
     try:
-        inquiries_ref = db.collection('inquiries').order_by('submittedAt', direction=firestore.Query.DESCENDING).stream()
-        return jsonify([dict(doc.to_dict(), id=doc.id) for doc in inquiries_ref]), 200
+        filters = {'viewed': parse_bool(request.args.get('viewed'))}
+        return jsonify(list_collection_page('inquiries', filters, request.args)), 200
+    except ValueError as e: return jsonify({"message": str(e)}), 400
     except Exception as e: return jsonify({"message": f"Could not retrieve inquiries: {e}"}), 500
 
+@app.route('/api/inquiries/export', methods=['GET'])
+@token_required
+def export_inquiries():
+    try:
+        filters = {'viewed': parse_bool(request.args.get('viewed'))}
+        return export_collection('inquiries', filters, request.args)
+    except ValueError as e: return jsonify({"message": str(e)}), 400
+    except Exception as e: return jsonify({"message": f"Could not export inquiries: {e}"}), 500
+
 @app.route('/api/inquiries/mark-as-read', methods=['POST'])
 @token_required
 def mark_inquiries_as_read():
@@ -356,4 +1837,6 @@ def delete_inquiry(inquiry_id):
         print(f"Error deleting inquiry: {e}")
         return jsonify({"message": f"Could not delete inquiry: {e}"}), 500
 
-# The if __name__ == '__main__': block is removed because Vercel handles the server execution.
\ No newline at end of file
+# The if __name__ == '__main__': block is removed because Vercel handles the server execution.
+
+record_startup('module', _module_started)
@@ -0,0 +1,79 @@
+# ====================================================================
+# Cold-start benchmark for api/index.py.
+# Imports the module in fresh interpreters and reports how long the import and
+# a first OPTIONS preflight take. Pass --baseline <git-rev> to measure an older
+# version of the file side by side.
+#
+#   python bench/cold_import.py --runs 15 --baseline HEAD~1
+# ====================================================================
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter: loads the module from a path and times it.
+PROBE = """
+import sys, time, json, importlib.util
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location('index', sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+imported = time.perf_counter()
+module.app.test_client().options('/api/positions')
+preflight = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000, 'preflight_ms': (preflight - imported) * 1000}))
+"""
+
+def throwaway_credentials():
+    """A syntactically valid service account so older, eager versions can initialize offline."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    return json.dumps({
+        'type': 'service_account',
+        'project_id': 'bench-project',
+        'private_key_id': 'bench',
+        'private_key': pem.decode(),
+        'client_email': 'bench@bench-project.iam.gserviceaccount.com',
+        'client_id': '0',
+        'token_uri': 'https://oauth2.googleapis.com/token',
+    })
+
+def measure(path, runs, env):
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', PROBE, path], env=env, capture_output=True, text=True, check=True)
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    summary = {}
+    for key in ('import_ms', 'preflight_ms'):
+        values = [sample[key] for sample in samples]
+        summary[key] = {'median': round(statistics.median(values), 2), 'min': round(min(values), 2), 'max': round(max(values), 2)}
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold-import latency of api/index.py.')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--baseline', help='git revision of api/index.py to compare against')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault('GOOGLE_APPLICATION_CREDENTIALS_JSON', throwaway_credentials())
+    results = {'current': measure(os.path.join(ROOT, 'api', 'index.py'), args.runs, env)}
+    if args.baseline:
+        source = subprocess.run(['git', 'show', f'{args.baseline}:api/index.py'], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index.py')
+            with open(path, 'w') as f:
+                f.write(source)
+            results[args.baseline] = measure(path, args.runs, env)
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
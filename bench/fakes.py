@@ -0,0 +1,667 @@
+# ====================================================================
+# In-memory stand-ins for Firestore, Cloud Storage, Firebase Auth and Brevo.
+# install() wires them into a loaded api/index.py so the Flask app can be
+# exercised locally, with optional per-call latency to mimic the network.
+# Only the parts of each SDK that api/index.py uses are implemented.
+# ====================================================================
+
+import os
+import time
+import uuid
+import threading
+from datetime import datetime, timezone
+from functools import cmp_to_key
+from types import SimpleNamespace
+from urllib.parse import quote
+
+ASCENDING = 'ASCENDING'
+DESCENDING = 'DESCENDING'
+DOCUMENT_ID = '__name__'
+_MISSING = object()
+
+class NotFound(Exception):
+    pass
+
+class FailedPrecondition(Exception):
+    pass
+
+class AlreadyExists(Exception):
+    pass
+
+class _ServerTimestamp:
+    def __repr__(self):
+        return 'SERVER_TIMESTAMP'
+
+SERVER_TIMESTAMP = _ServerTimestamp()
+
+class Increment:
+    def __init__(self, value):
+        self.value = value
+
+def pause(latency_ms):
+    if latency_ms:
+        time.sleep(latency_ms / 1000)
+
+def now():
+    return datetime.now(timezone.utc)
+
+def _resolve(value, existing=_MISSING):
+    """Applies write sentinels the way the server would."""
+    if value is SERVER_TIMESTAMP:
+        return now()
+    if isinstance(value, Increment):
+        base = existing if isinstance(existing, (int, float)) and not isinstance(existing, bool) else 0
+        return base + value.value
+    if isinstance(value, dict):
+        return {k: _resolve(v) for k, v in value.items()}
+    return value
+
+def _merge(target, updates):
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = _resolve(value, target.get(key, _MISSING))
+
+def _copy(data):
+    return {k: (dict(v) if isinstance(v, dict) else list(v) if isinstance(v, list) else v) for k, v in data.items()}
+
+def _sort_value(value):
+    # Firestore orders values by type first; this keeps mixed types comparable.
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, value)
+    if isinstance(value, str):
+        return (4, value)
+    return (5, repr(value))
+
+def _hashable(value):
+    try:
+        hash(value)
+        return True
+    except TypeError:
+        return False
+
+class _Collection:
+    """Documents of one collection plus lazily built lookup indexes."""
+
+    def __init__(self):
+        self.docs = {}  # id -> (data, update_time)
+        self.version = 0
+        self._sorted = {}
+        self._equality = {}
+        self._contains = {}
+
+    def put(self, doc_id, data, update_time):
+        old = self.docs.get(doc_id)
+        if old is not None:
+            self._unindex(doc_id, old[0])
+        self.docs[doc_id] = (data, update_time)
+        self._index(doc_id, data)
+        self.version += 1
+
+    def remove(self, doc_id):
+        old = self.docs.pop(doc_id, None)
+        if old is not None:
+            self._unindex(doc_id, old[0])
+            self.version += 1
+
+    def _index(self, doc_id, data):
+        for field, index in self._equality.items():
+            value = data.get(field, _MISSING)
+            if value is not _MISSING and _hashable(value):
+                index.setdefault(value, set()).add(doc_id)
+        for field, index in self._contains.items():
+            for element in data.get(field) or []:
+                if _hashable(element):
+                    index.setdefault(element, set()).add(doc_id)
+
+    def _unindex(self, doc_id, data):
+        for field, index in self._equality.items():
+            value = data.get(field, _MISSING)
+            if value is not _MISSING and _hashable(value):
+                index.get(value, set()).discard(doc_id)
+        for field, index in self._contains.items():
+            for element in data.get(field) or []:
+                if _hashable(element):
+                    index.get(element, set()).discard(doc_id)
+
+    def equal_ids(self, field, value):
+        if field not in self._equality:
+            self._equality[field] = {}
+            for doc_id, (data, _) in self.docs.items():
+                stored = data.get(field, _MISSING)
+                if stored is not _MISSING and _hashable(stored):
+                    self._equality[field].setdefault(stored, set()).add(doc_id)
+        return self._equality[field].get(value, set()) if _hashable(value) else set()
+
+    def contains_ids(self, field, value):
+        if field not in self._contains:
+            self._contains[field] = {}
+            for doc_id, (data, _) in self.docs.items():
+                for element in data.get(field) or []:
+                    if _hashable(element):
+                        self._contains[field].setdefault(element, set()).add(doc_id)
+        return self._contains[field].get(value, set())
+
+    def sorted_ids(self, orders):
+        """All ids that have every order field, sorted; cached until the collection changes."""
+        key = tuple(orders)
+        cached = self._sorted.get(key)
+        if cached is None or cached[0] != self.version:
+            cached = (self.version, self.sort(list(self.docs), orders))
+            self._sorted[key] = cached
+        return cached[1]
+
+    def sort_key(self, doc_id, orders):
+        data = self.docs[doc_id][0]
+        values = []
+        for field, _ in orders:
+            value = doc_id if field == DOCUMENT_ID else data.get(field, _MISSING)
+            if value is _MISSING:
+                return None
+            values.append(_sort_value(value))
+        return tuple(values)
+
+    def sort(self, ids, orders):
+        keyed = [(k, doc_id) for doc_id in ids if (k := self.sort_key(doc_id, orders)) is not None]
+        directions = {direction for _, direction in orders}
+        if len(directions) == 1:
+            keyed.sort(key=lambda item: item[0], reverse=DESCENDING in directions)
+        else:
+            keyed.sort(key=cmp_to_key(lambda a, b: compare_keys(a[0], b[0], orders)))
+        return [doc_id for _, doc_id in keyed]
+
+def compare_keys(a, b, orders):
+    for left, right, (_, direction) in zip(a, b, orders):
+        if left != right:
+            result = -1 if left < right else 1
+            return -result if direction == DESCENDING else result
+    return 0
+
+class FakeSnapshot:
+    def __init__(self, reference, data, update_time):
+        self.reference = reference
+        self._data = data
+        self.update_time = update_time
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return _copy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        if self._data is None or field not in self._data:
+            raise KeyError(field)
+        return self._data[field]
+
+class FakeWriteOption:
+    def __init__(self, last_update_time):
+        self.last_update_time = last_update_time
+
+class FakeDocumentReference:
+    def __init__(self, db, collection_name, doc_id):
+        self._db = db
+        self._collection_name = collection_name
+        self.id = doc_id
+
+    @property
+    def path(self):
+        return f"{self._collection_name}/{self.id}"
+
+    def _snapshot(self):
+        stored = self._db._collection(self._collection_name).docs.get(self.id)
+        if stored is None:
+            return FakeSnapshot(self, None, None)
+        return FakeSnapshot(self, stored[0], stored[1])
+
+    def get(self, transaction=None):
+        started = time.perf_counter()
+        self._db._rpc()
+        self._db._count_reads(1)
+        snapshot = self._snapshot()
+        self._db._timed(started)
+        return snapshot
+
+    def set(self, data, merge=False):
+        self._db._commit([('set', self, data, merge)])
+
+    def update(self, data, option=None):
+        self._db._commit([('update', self, data, option)])
+
+    def delete(self, option=None):
+        self._db._commit([('delete', self, None, option)])
+
+class FakeQuery:
+    def __init__(self, db, collection_name, filters=(), orders=(), projection=None, limit=None, cursor=None):
+        self._db = db
+        self._collection_name = collection_name
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._projection = projection
+        self._limit = limit
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, orders=self._orders, projection=self._projection,
+                     limit=self._limit, cursor=self._cursor)
+        state.update(changes)
+        return FakeQuery(self._db, self._collection_name, **state)
+
+    def where(self, field, op, value):
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field, direction),))
+
+    def select(self, fields):
+        return self._copy(projection=list(fields))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, cursor):
+        return self._copy(cursor=cursor)
+
+    def _effective_orders(self):
+        orders = list(self._orders)
+        if not any(field == DOCUMENT_ID for field, _ in orders):
+            # Firestore breaks ties by document id in the direction of the last ordering.
+            orders.append((DOCUMENT_ID, orders[-1][1] if orders else ASCENDING))
+        return orders
+
+    def _cursor_key(self, orders):
+        if isinstance(self._cursor, FakeSnapshot):
+            collection = self._db._collection(self._collection_name)
+            if self._cursor.id in collection.docs:
+                return collection.sort_key(self._cursor.id, orders)
+            values = dict(self._cursor._data or {}, **{DOCUMENT_ID: self._cursor.id})
+        else:
+            values = dict(self._cursor)
+        key = []
+        for field, _ in orders:
+            value = values.get(field)
+            key.append(_sort_value(value.id if isinstance(value, FakeDocumentReference) else value))
+        return tuple(key)
+
+    def _matches(self, data, doc_id):
+        for field, op, value in self._filters:
+            stored = doc_id if field == DOCUMENT_ID else data.get(field, _MISSING)
+            if stored is _MISSING:
+                return False
+            if op == '==' and stored != value:
+                return False
+            if op == 'array_contains' and (not isinstance(stored, list) or value not in stored):
+                return False
+            if op in ('<', '<=', '>', '>='):
+                try:
+                    if not {'<': stored < value, '<=': stored <= value, '>': stored > value, '>=': stored >= value}[op]:
+                        return False
+                except TypeError:
+                    return False
+        return True
+
+    def _run(self):
+        collection = self._db._collection(self._collection_name)
+        candidates = None
+        for field, op, value in self._filters:
+            if op == '==':
+                ids = collection.equal_ids(field, value)
+            elif op == 'array_contains':
+                ids = collection.contains_ids(field, value)
+            else:
+                continue
+            candidates = set(ids) if candidates is None else candidates & ids
+        orders = self._effective_orders()
+        if candidates is not None and len(candidates) * 10 < max(len(collection.docs), 1):
+            ordered = collection.sort(candidates, orders)
+        else:
+            ordered = collection.sorted_ids(orders)
+            if candidates is not None:
+                ordered = (doc_id for doc_id in ordered if doc_id in candidates)
+        cursor_key = self._cursor_key(orders) if self._cursor is not None else None
+
+        results = []
+        for doc_id in ordered:
+            if cursor_key is not None and compare_keys(collection.sort_key(doc_id, orders), cursor_key, orders) <= 0:
+                continue
+            data, update_time = collection.docs[doc_id]
+            if not self._matches(data, doc_id):
+                continue
+            if self._projection is not None:
+                data = {field: data[field] for field in self._projection if field in data}
+            results.append(FakeSnapshot(FakeDocumentReference(self._db, self._collection_name, doc_id), data, update_time))
+            if self._limit is not None and len(results) >= self._limit:
+                break
+        return results
+
+    def stream(self, transaction=None):
+        started = time.perf_counter()
+        self._db._rpc()
+        with self._db._lock:
+            results = self._run()
+        # Firestore bills at least one read per query.
+        self._db._count_reads(max(1, len(results)))
+        self._db._timed(started)
+        return iter(results)
+
+    def count(self, alias=None):
+        return FakeAggregationQuery(self, alias or 'count')
+
+class FakeAggregationQuery:
+    def __init__(self, query, alias):
+        self._query = query
+        self._alias = alias
+
+    def get(self, transaction=None):
+        db = self._query._db
+        started = time.perf_counter()
+        db._rpc()
+        with db._lock:
+            value = len(self._query._run())
+        # Count aggregations bill one read per 1000 index entries, minimum one.
+        db._count_reads(max(1, -(-value // 1000)))
+        db._timed(started)
+        return [[SimpleNamespace(alias=self._alias, value=value, read_time=datetime.now(timezone.utc))]]
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, db, name):
+        super().__init__(db, name)
+        self.id = name
+
+    def document(self, doc_id=None):
+        return FakeDocumentReference(self._db, self._collection_name, doc_id or uuid.uuid4().hex[:20])
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return now(), ref
+
+class FakeWriteBatch:
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def create(self, ref, data):
+        self._writes.append(('create', ref, data, None))
+
+    def set(self, ref, data, merge=False):
+        self._writes.append(('set', ref, data, merge))
+
+    def update(self, ref, data, option=None):
+        self._writes.append(('update', ref, data, option))
+
+    def delete(self, ref, option=None):
+        self._writes.append(('delete', ref, None, option))
+
+    def commit(self):
+        writes, self._writes = self._writes, []
+        return self._db._commit(writes)
+
+class FakeTransaction(FakeWriteBatch):
+    def __init__(self, db):
+        super().__init__(db)
+        db._rpc()  # BeginTransaction
+
+def transactional(function):
+    def run(transaction, *args, **kwargs):
+        result = function(transaction, *args, **kwargs)
+        transaction.commit()
+        return result
+    return run
+
+class FakeFirestore:
+    """In-memory Firestore client. on_read/on_write receive document counts, on_time each call's start."""
+
+    def __init__(self, latency_ms=0.0, on_read=None, on_write=None, on_time=None):
+        self.latency_ms = latency_ms
+        self.on_read = on_read
+        self.on_write = on_write
+        self.on_time = on_time
+        self._collections = {}
+        self._lock = threading.RLock()
+
+    def _collection(self, name):
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections.setdefault(name, _Collection())
+        return collection
+
+    def _rpc(self):
+        pause(self.latency_ms)
+
+    def _timed(self, started):
+        if self.on_time:
+            self.on_time(started)
+
+    def _count_reads(self, count):
+        if self.on_read:
+            self.on_read(count)
+
+    def collection(self, name):
+        return FakeCollectionReference(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    def write_option(self, last_update_time=None):
+        return FakeWriteOption(last_update_time)
+
+    def get_all(self, references, transaction=None):
+        started = time.perf_counter()
+        self._rpc()
+        with self._lock:
+            snapshots = [ref._snapshot() for ref in references]
+        self._count_reads(len(snapshots))
+        self._timed(started)
+        return iter(snapshots)
+
+    def seed(self, collection_name, doc_id, data):
+        """Stores a document directly, without latency or counting."""
+        self._collection(collection_name).put(doc_id, _resolve(data), now())
+
+    def count(self, collection_name):
+        return len(self._collection(collection_name).docs)
+
+    def _commit(self, writes):
+        started = time.perf_counter()
+        self._rpc()
+        with self._lock:
+            # Check every precondition first so the commit is all-or-nothing.
+            for op, ref, _, option in writes:
+                stored = self._collection(ref._collection_name).docs.get(ref.id)
+                if op == 'create' and stored is not None:
+                    raise AlreadyExists(f"Document already exists: {ref.path}")
+                if op in ('update', 'delete') and option is not None:
+                    if stored is None or option.last_update_time != stored[1]:
+                        raise FailedPrecondition(f"Document changed since it was read: {ref.path}")
+                elif op == 'update' and stored is None:
+                    raise NotFound(f"No document to update: {ref.path}")
+            commit_time = now()
+            for op, ref, data, merge in writes:
+                collection = self._collection(ref._collection_name)
+                stored = collection.docs.get(ref.id)
+                if op == 'delete':
+                    collection.remove(ref.id)
+                    continue
+                if op == 'create' or (op == 'set' and not merge):
+                    collection.put(ref.id, _resolve(data), commit_time)
+                    continue
+                current = _copy(stored[0]) if stored is not None else {}
+                if op == 'set':
+                    _merge(current, data)
+                else:
+                    for field, value in data.items():
+                        current[field] = _resolve(value, current.get(field, _MISSING))
+                collection.put(ref.id, current, commit_time)
+        if self.on_write:
+            self.on_write(len(writes))
+        self._timed(started)
+        return [SimpleNamespace(update_time=commit_time) for _ in writes]
+
+def firestore_module(db):
+    """The slice of firebase_admin.firestore that api/index.py touches."""
+    return SimpleNamespace(
+        SERVER_TIMESTAMP=SERVER_TIMESTAMP,
+        Increment=Increment,
+        Query=SimpleNamespace(ASCENDING=ASCENDING, DESCENDING=DESCENDING),
+        transactional=transactional,
+        client=lambda app=None: db,
+    )
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.content_type = None
+        self.size = None
+        self.chunk_size = None
+        self.public = False
+
+    @property
+    def public_url(self):
+        return f"https://storage.googleapis.com/{self.bucket.name}/{quote(self.name)}"
+
+    def upload_from_file(self, file_obj, content_type=None, predefined_acl=None, **kwargs):
+        self.public = predefined_acl == 'publicRead'
+        size = 0
+        chunk_size = self.chunk_size or 8 * 1024 * 1024
+        while True:
+            chunk = file_obj.read(chunk_size)
+            if not chunk and size:
+                break
+            self.bucket._call()  # One request per chunk, like a resumable upload
+            if not chunk:
+                break
+            size += len(chunk)
+        self.content_type = content_type
+        self.size = size
+        self.bucket._objects[self.name] = self
+
+    def create_resumable_upload_session(self, content_type=None, size=None, origin=None, predefined_acl=None, **kwargs):
+        self.bucket._call()
+        return f"https://storage.googleapis.com/upload/fake-session/{uuid.uuid4().hex}"
+
+    def delete(self):
+        self.bucket._call()
+        self.bucket._objects.pop(self.name, None)
+
+    def make_public(self):
+        self.bucket._call()
+        self.public = True
+
+class FakeBucket:
+    def __init__(self, name='fake-bucket', latency_ms=0.0, on_call=None):
+        self.name = name
+        self.latency_ms = latency_ms
+        self.on_call = on_call  # Receives each call's start time
+        self._objects = {}
+
+    def _call(self):
+        started = time.perf_counter()
+        pause(self.latency_ms)
+        if self.on_call:
+            self.on_call(started)
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        self._call()
+        return self._objects.get(name)
+
+    def copy_blob(self, blob, destination_bucket, new_name=None):
+        self._call()
+        copy = FakeBlob(destination_bucket, new_name or blob.name)
+        copy.content_type, copy.size = blob.content_type, blob.size
+        destination_bucket._objects[copy.name] = copy
+        return copy
+
+class FakeAuth:
+    """Accepts any token except 'invalid' and returns claims valid for an hour."""
+
+    def __init__(self, latency_ms=0.0):
+        self.latency_ms = latency_ms
+        self.verifications = 0
+
+    def verify_id_token(self, id_token, app=None, check_revoked=False):
+        pause(self.latency_ms)
+        self.verifications += 1
+        if id_token == 'invalid':
+            raise ValueError("Invalid token.")
+        return {'uid': id_token, 'email': f'{id_token}@example.com', 'exp': time.time() + 3600}
+
+class ApiException(Exception):
+    def __init__(self, status=None, reason=None):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+class FakeBrevo:
+    """Stands in for the sib_api_v3_sdk module; sent messages are kept in `sent`."""
+
+    def __init__(self, latency_ms=0.0):
+        self.latency_ms = latency_ms
+        self.sent = []
+        brevo = self
+
+        class Configuration:
+            def __init__(self):
+                self.api_key = {}
+
+        class TransactionalEmailsApi:
+            def __init__(self, api_client=None):
+                self.api_client = api_client
+
+            def send_transac_email(self, send_smtp_email):
+                pause(brevo.latency_ms)
+                brevo.sent.append(send_smtp_email)
+
+        self.Configuration = Configuration
+        self.ApiClient = lambda configuration=None: SimpleNamespace(configuration=configuration)
+        self.TransactionalEmailsApi = TransactionalEmailsApi
+        self.SendSmtpEmail = lambda **kwargs: kwargs
+
+def install(index, firestore_latency_ms=0.0, storage_latency_ms=0.0, auth_latency_ms=0.0, brevo_latency_ms=0.0):
+    """Points a loaded api/index.py module at fresh fakes and returns them."""
+    db = FakeFirestore(firestore_latency_ms,
+                       on_read=lambda n: index.track('firestore_reads', n),
+                       on_write=lambda n: index.track('firestore_writes', n),
+                       on_time=lambda started: index.track_time('firestore', started))
+
+    def storage_call(started):
+        index.track('storage_calls')
+        index.track_time('storage', started)
+
+    bucket = FakeBucket(latency_ms=storage_latency_ms, on_call=storage_call)
+    fake_auth = FakeAuth(auth_latency_ms)
+    brevo = FakeBrevo(brevo_latency_ms)
+
+    index.firestore = firestore_module(db)
+    index.api_exceptions = SimpleNamespace(NotFound=NotFound, FailedPrecondition=FailedPrecondition, AlreadyExists=AlreadyExists)
+    index.auth = fake_auth
+    index.sib_api_v3_sdk = brevo
+    index.sib_rest = SimpleNamespace(ApiException=ApiException)
+    os.environ.setdefault('BREVO_API_KEY', 'fake-key')
+    os.environ.setdefault('EMAIL_SENDER', 'bench@example.com')
+    os.environ['EMAIL_TRANSPORT'] = 'brevo'
+
+    index.clients.set('firebase', SimpleNamespace(name='[FAKE]'))
+    index.clients.set('firestore', db)
+    index.clients.set('storage', bucket)
+    index.clients.reset('email_transport')
+    return SimpleNamespace(db=db, bucket=bucket, auth=fake_auth, brevo=brevo)
@@ -0,0 +1,295 @@
+# ====================================================================
+# Load test for api/index.py against in-memory fakes (see bench/fakes.py).
+# Seeds a synthetic dataset, drives the Flask app through its test client and
+# writes per-endpoint throughput, latency percentiles and backend call counts
+# as JSON. Latency can be injected per backend to mimic network round trips.
+#
+#   python bench/loadtest.py --applications 100000 --firestore-latency 5 --output results.json
+#   python bench/loadtest.py --compare results.json
+# ====================================================================
+
+import io
+import os
+import sys
+import json
+import random
+import argparse
+import importlib.util
+import itertools
+import statistics
+import subprocess
+import threading
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+
+import fakes
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_TOKEN = 'bench-admin'
+POSITIONS = ['Data Annotator', 'AI Trainer', 'Transcriptionist', 'Translator', 'QA Analyst', 'Project Manager', 'Software Engineer', 'Researcher']
+STATUSES = ['Received'] * 5 + ['Under Review'] * 2 + ['Interview Scheduled', 'Offer Extended', 'Hired', 'Rejected']
+FIRST_NAMES = ['Maria', 'Jose', 'Ana', 'Juan', 'Liza', 'Mark', 'Grace', 'Paolo', 'Kim', 'Rafael', 'Joy', 'Carlo']
+LAST_NAMES = ['Santos', 'Reyes', 'Cruz', 'Bautista', 'Garcia', 'Mendoza', 'Torres', 'Flores', 'Ramos', 'Aquino']
+SCENARIOS = ['apply', 'get_applications', 'application_trends', 'mark_applications_read', 'mark_inquiries_read', 'bulk_delete']
+
+def load_app(path):
+    spec = importlib.util.spec_from_file_location('index', path)
+    module = importlib.util.module_from_spec(spec)
+    with redirect_stdout(io.StringIO()):
+        spec.loader.exec_module(module)
+    return module
+
+def synthetic_application(rng, number, now):
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    return {
+        'firstName': first,
+        'lastName': last,
+        'email': f'{first}.{last}{number}@example.com'.lower(),
+        'position': rng.choice(POSITIONS),
+        'age': str(rng.randint(18, 60)),
+        'degree': 'BS Computer Science',
+        'status': rng.choice(STATUSES),
+        'viewed': True,
+        'submittedAt': now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600)),
+    }
+
+def seed(index, services, applications, inquiries, search, rng):
+    """Writes the dataset straight into the fake store, keeping the derived collections consistent."""
+    now = datetime.now(timezone.utc)
+    db = services.db
+    deltas = {}
+    for number in range(applications):
+        data = synthetic_application(rng, number, now)
+        doc_id = f'app{number:08d}'
+        db.seed('applications', doc_id, data)
+        index.add_stats_delta(deltas, data, 1)
+        if search:
+            db.seed(index.SEARCH_COLLECTION, doc_id, index.search_document(data))
+    for day, counts in deltas.items():
+        db.seed(index.ANALYTICS_COLLECTION, day, index.stats_payload(day, counts, increment=False))
+    for number in range(inquiries):
+        db.seed('inquiries', f'inq{number:08d}', {
+            'name': rng.choice(FIRST_NAMES), 'email': f'inquiry{number}@example.com', 'message': 'Hello',
+            'viewed': True, 'submittedAt': now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600)),
+        })
+    for title in POSITIONS:
+        db.seed('positions', title.lower().replace(' ', '-'), {'title': title})
+
+class Scenario:
+    """One endpoint under test. prepare() runs untimed before each request and returns its kwargs."""
+
+    def __init__(self, name, method, path, prepare=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.prepare = prepare or (lambda number: {})
+
+def build_scenarios(services, args, rng):
+    db = services.db
+    lock = threading.Lock()
+    admin = {'Authorization': f'Bearer {ADMIN_TOKEN}'}
+
+    applicants = itertools.count(args.applications)
+
+    def apply_form(number):
+        # A new applicant from a new address each time, so neither the rate limits nor the dedup kick in.
+        with lock:
+            applicant = next(applicants)
+        data = synthetic_application(rng, applicant, datetime.now(timezone.utc))
+        form = {k: v for k, v in data.items() if k not in ('status', 'viewed', 'submittedAt')}
+        if args.resume_bytes:
+            form['resumeFile'] = (io.BytesIO(b'%PDF-1.4\n' + b'0' * args.resume_bytes), 'resume.pdf', 'application/pdf')
+        address = f'10.{applicant >> 16 & 255}.{applicant >> 8 & 255}.{applicant & 255}'
+        return {'data': form, 'content_type': 'multipart/form-data', 'headers': {'X-Forwarded-For': address}}
+
+    def mark_unread(collection_name):
+        docs = db._collection(collection_name).docs
+        ids = []
+
+        def prepare(number):
+            # Flag a fresh sample as unread so every request has the same amount of work.
+            with lock:
+                if not ids:
+                    ids.extend(docs)
+                for doc_id in rng.sample(ids, min(args.unread, len(ids))):
+                    if doc_id in docs:
+                        db.seed(collection_name, doc_id, dict(docs[doc_id][0], viewed=False))
+            return {'headers': admin}
+        return prepare
+
+    def bulk_ids(number):
+        # Deletes freshly seeded applications so the dataset keeps its size across runs.
+        now = datetime.now(timezone.utc)
+        ids = []
+        with lock:
+            for i in range(args.bulk_size):
+                doc_id = f'bulk{number:06d}x{i:04d}'
+                db.seed('applications', doc_id, synthetic_application(rng, i, now))
+                ids.append(doc_id)
+        return {'headers': admin, 'json': {'ids': ids, 'operation': 'delete'}}
+
+    return {
+        'apply': Scenario('apply', 'post', '/api/apply', apply_form),
+        'get_applications': Scenario('get_applications', 'get', f'/api/applications?limit={args.page_size}', lambda n: {'headers': admin}),
+        'application_trends': Scenario('application_trends', 'get', f'/api/analytics/application-trends?days={args.trend_days}', lambda n: {'headers': admin}),
+        'mark_applications_read': Scenario('mark_applications_read', 'post', '/api/applications/mark-as-read', mark_unread('applications')),
+        'mark_inquiries_read': Scenario('mark_inquiries_read', 'post', '/api/inquiries/mark-as-read', mark_unread('inquiries')),
+        'bulk_delete': Scenario('bulk_delete', 'post', '/api/applications/bulk', bulk_ids),
+    }
+
+def parse_server_timing(header):
+    """Turns 'firestore;dur=1.2, calls;desc="firestore_reads=3 ..."' into numbers."""
+    values = {}
+    for part in (header or '').split(','):
+        name, _, rest = part.strip().partition(';')
+        if rest.startswith('dur='):
+            values[f'{name}_ms'] = float(rest[4:])
+        elif rest.startswith('desc='):
+            for pair in rest[5:].strip('"').split():
+                key, _, count = pair.partition('=')
+                if count.isdigit():
+                    values[key] = int(count)
+    return values
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    position = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[position]
+
+def run_scenario(app, scenario, requests, concurrency, warmup):
+    client = app.test_client()
+    for number in range(warmup):
+        getattr(client, scenario.method)(scenario.path, **scenario.prepare(number))
+
+    latencies, statuses, timings = [], {}, {}
+    counter = iter(range(requests))
+    lock = threading.Lock()
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                number = next(counter, None)
+            if number is None:
+                return
+            kwargs = scenario.prepare(number)
+            started = time.perf_counter()
+            response = getattr(client, scenario.method)(scenario.path, **kwargs)
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                for key, value in parse_server_timing(response.headers.get('Server-Timing')).items():
+                    timings[key] = timings.get(key, 0) + value
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else 0.0,
+        'latency_ms': {
+            'mean': round(statistics.fmean(latencies), 3) if latencies else 0.0,
+            'p50': round(percentile(latencies, 0.50), 3),
+            'p95': round(percentile(latencies, 0.95), 3),
+            'p99': round(percentile(latencies, 0.99), 3),
+            'max': round(latencies[-1], 3) if latencies else 0.0,
+        },
+        'per_request': {key: round(value / len(latencies), 3) for key, value in sorted(timings.items())} if latencies else {},
+    }
+
+def git_revision():
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+def compare(previous, current):
+    """Prints the change in p50, p95 and throughput against an earlier results file."""
+    for name, result in current['scenarios'].items():
+        before = previous.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        changes = []
+        for label, old, new in (('p50', before['latency_ms']['p50'], result['latency_ms']['p50']),
+                                ('p95', before['latency_ms']['p95'], result['latency_ms']['p95']),
+                                ('rps', before['throughput_rps'], result['throughput_rps'])):
+            delta = f"{(new - old) / old * 100:+.1f}%" if old else 'n/a'
+            changes.append(f"{label} {old} -> {new} ({delta})")
+        print(f"{name}: " + ', '.join(changes), file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test api/index.py against in-memory backends.')
+    parser.add_argument('--applications', type=int, default=10000, help='synthetic applications to seed')
+    parser.add_argument('--inquiries', type=int, default=None, help='synthetic inquiries to seed (default: applications / 10)')
+    parser.add_argument('--search-index', action='store_true', help='also seed the search index (slow for large datasets)')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated subset of: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per scenario')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--trend-days', type=int, default=30)
+    parser.add_argument('--unread', type=int, default=20, help='documents flagged unread before each mark-as-read request')
+    parser.add_argument('--bulk-size', type=int, default=100, help='ids per bulk delete request')
+    parser.add_argument('--resume-bytes', type=int, default=0, help='attach a resume of this size to each application')
+    parser.add_argument('--firestore-latency', type=float, default=0.0, help='milliseconds added to every Firestore call')
+    parser.add_argument('--storage-latency', type=float, default=0.0)
+    parser.add_argument('--auth-latency', type=float, default=0.0)
+    parser.add_argument('--brevo-latency', type=float, default=0.0)
+    parser.add_argument('--no-token-cache', action='store_true', help='verify the admin token on every request')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results here instead of stdout')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    rng = random.Random(args.seed)
+    index = load_app(os.path.join(ROOT, 'api', 'index.py'))
+    services = fakes.install(index, args.firestore_latency, args.storage_latency, args.auth_latency, args.brevo_latency)
+    if args.no_token_cache:
+        index.token_cache = index.TokenCache(0)
+
+    started = time.perf_counter()
+    inquiries = args.inquiries if args.inquiries is not None else args.applications // 10
+    seed(index, services, args.applications, inquiries, args.search_index, rng)
+    seed_seconds = time.perf_counter() - started
+    print(f"Seeded {args.applications} applications and {inquiries} inquiries in {seed_seconds:.1f}s", file=sys.stderr)
+
+    available = build_scenarios(services, args, rng)
+    results = {
+        'revision': git_revision(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        'seed_seconds': round(seed_seconds, 2),
+        'scenarios': {},
+    }
+    for name in scenarios:
+        # The app logs one line per request; keep it out of the results.
+        with redirect_stdout(io.StringIO()):
+            results['scenarios'][name] = run_scenario(index.app, available[name], args.requests, args.concurrency, args.warmup)
+        summary = results['scenarios'][name]
+        print(f"{name}: {summary['throughput_rps']} req/s, p50 {summary['latency_ms']['p50']} ms, "
+              f"p95 {summary['latency_ms']['p95']} ms, statuses {summary['statuses']}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()